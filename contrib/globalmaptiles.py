@@ -65,8 +65,22 @@ Class is available under the open-source GDAL license (www.gdal.org).
 
 import math
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAXZOOMLEVEL = 32
+
 
 class GlobalMercator(object):
+    """
+    The methods ending with Array take sequences (or numpy arrays) of coordinates
+    or tiles instead of single values and return numpy arrays, or lists if numpy
+    is not available. The zoom level is a single value for all of them.
+    """
+    _zoomTables = {}
+
     def __init__(self, tileSize=256):
         "Initialize the TMS Global Mercator pyramid"
         self.tileSize = tileSize
@@ -74,6 +88,18 @@ class GlobalMercator(object):
         # 156543.03392804062 for tileSize 256 pixels
         self.originShift = 2 * math.pi * 6378137 / 2.0
         # 20037508.342789244
+        self.resolutions, self.tileMeters = self.ZoomTable(tileSize)
+
+    @classmethod
+    def ZoomTable(cls, tileSize):
+        "Resolutions and tile sizes in meters of all zoom levels, computed once per tile size"
+
+        table = cls._zoomTables.get(tileSize)
+        if table is None:
+            initialResolution = 2 * math.pi * 6378137 / tileSize
+            resolutions = [initialResolution / (2 ** zoom) for zoom in range(MAXZOOMLEVEL)]
+            table = cls._zoomTables[tileSize] = (resolutions, [tileSize * res for res in resolutions])
+        return table
 
     def LatLonToMeters(self, lat, lon):
         "Converts given lat/lon in WGS84 Datum to XY in Spherical Mercator EPSG:900913"
@@ -148,6 +174,8 @@ class GlobalMercator(object):
         "Resolution (meters/pixel) for given zoom level (measured at Equator)"
 
         # return (2 * math.pi * 6378137) / (self.tileSize * 2**zoom)
+        if 0 <= zoom < MAXZOOMLEVEL and zoom == int(zoom):
+            return self.resolutions[int(zoom)]
         return self.initialResolution / (2 ** zoom)
 
     def ZoomForPixelSize(self, pixelSize):
@@ -179,6 +207,91 @@ class GlobalMercator(object):
 
         return quadKey
 
+    def LatLonToMetersArray(self, lat, lon):
+        "Converts arrays of lat/lon in WGS84 Datum to XY in Spherical Mercator EPSG:900913"
+
+        if numpy is None:
+            return _unzip([self.LatLonToMeters(a, o) for a, o in zip(lat, lon)], 2)
+        lat = numpy.asarray(lat, dtype=numpy.float64)
+        mx = numpy.asarray(lon, dtype=numpy.float64) * self.originShift / 180.0
+        my = numpy.log(numpy.tan((90 + lat) * math.pi / 360.0)) / (math.pi / 180.0)
+
+        my = my * self.originShift / 180.0
+        return mx, my
+
+    def MetersToLatLonArray(self, mx, my):
+        "Converts arrays of XY points from Spherical Mercator EPSG:900913 to lat/lon in WGS84 Datum"
+
+        if numpy is None:
+            return _unzip([self.MetersToLatLon(x, y) for x, y in zip(mx, my)], 2)
+        lon = (numpy.asarray(mx, dtype=numpy.float64) / self.originShift) * 180.0
+        lat = (numpy.asarray(my, dtype=numpy.float64) / self.originShift) * 180.0
+
+        lat = 180 / math.pi * (2 * numpy.arctan(numpy.exp(lat * math.pi / 180.0)) - math.pi / 2.0)
+        return lat, lon
+
+    def MetersToTileArray(self, mx, my, zoom):
+        "Returns the tiles for given arrays of mercator coordinates"
+
+        if numpy is None:
+            return _unzip([self.MetersToTile(x, y, zoom) for x, y in zip(mx, my)], 2)
+        res = self.Resolution(zoom)
+        px = (numpy.asarray(mx, dtype=numpy.float64) + self.originShift) / res
+        py = (numpy.asarray(my, dtype=numpy.float64) + self.originShift) / res
+        tx = (numpy.ceil(px / float(self.tileSize)) - 1).astype(numpy.int64)
+        ty = (numpy.ceil(py / float(self.tileSize)) - 1).astype(numpy.int64)
+        return tx, ty
+
+    def TileBoundsArray(self, tx, ty, zoom):
+        "Returns the bounds of the given arrays of tiles in EPSG:900913 coordinates"
+
+        if numpy is None:
+            return _unzip([self.TileBounds(x, y, zoom) for x, y in zip(tx, ty)], 4)
+        res = self.Resolution(zoom)
+        px = numpy.asarray(tx, dtype=numpy.int64) * self.tileSize
+        py = numpy.asarray(ty, dtype=numpy.int64) * self.tileSize
+        minx = px * res - self.originShift
+        miny = py * res - self.originShift
+        maxx = (px + self.tileSize) * res - self.originShift
+        maxy = (py + self.tileSize) * res - self.originShift
+        return minx, miny, maxx, maxy
+
+    def TileRangeArray(self, minx, miny, maxx, maxy, zoom):
+        "Returns all the tiles covering the given EPSG:900913 bounds, one row of tiles after the other"
+
+        txmin, tymin = self.MetersToTile(minx, miny, zoom)
+        txmax, tymax = self.MetersToTile(maxx, maxy, zoom)
+        if numpy is None:
+            tiles = [(tx, ty) for ty in range(tymin, tymax + 1) for tx in range(txmin, txmax + 1)]
+            return _unzip(tiles, 2)
+        tx, ty = numpy.meshgrid(numpy.arange(txmin, txmax + 1, dtype=numpy.int64),
+                                numpy.arange(tymin, tymax + 1, dtype=numpy.int64))
+        return tx.ravel(), ty.ravel()
+
+    def QuadTreeArray(self, tx, ty, zoom):
+        "Converts arrays of TMS tile coordinates to a list of Microsoft QuadTree keys"
+
+        if numpy is None:
+            return [self.QuadTree(x, y, zoom) for x, y in zip(tx, ty)]
+        tx = numpy.asarray(tx, dtype=numpy.int64)
+        ty = (2 ** zoom - 1) - numpy.asarray(ty, dtype=numpy.int64)
+        if zoom == 0:
+            return [""] * len(tx)
+        # one column of digits per zoom level, every row is the key of a tile
+        digits = numpy.empty((len(tx), zoom), dtype=numpy.uint8)
+        for column, i in enumerate(range(zoom, 0, -1)):
+            digits[:, column] = ord("0") + ((tx >> (i - 1)) & 1) + 2 * ((ty >> (i - 1)) & 1)
+        keys = digits.view("S%d" % zoom).ravel().tolist()
+        return keys if str is bytes else [key.decode("ascii") for key in keys]
+
+
+def _unzip(rows, count):
+    "Splits a list of tuples into count lists"
+
+    if not rows:
+        return tuple([] for _ in range(count))
+    return tuple(list(column) for column in zip(*rows))
+
 
 # ---------------------
 
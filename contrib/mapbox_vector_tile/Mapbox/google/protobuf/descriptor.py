@@ -106,7 +106,7 @@ class DescriptorBase(object):
     """
     if self._options:
       return self._options
-    from google.protobuf import descriptor_pb2
+    from . import descriptor_pb2
     try:
       options_class = getattr(descriptor_pb2, self._options_class_name)
     except AttributeError:
@@ -34,30 +34,18 @@
 import os
 import sys
 
-try:
-  # pylint: disable=g-import-not-at-top
-  from google.protobuf.internal import _api_implementation
-  # The compile-time constants in the _api_implementation module can be used to
-  # switch to a certain implementation of the Python API at build time.
-  _api_version = _api_implementation.api_version
-  del _api_implementation
-except ImportError:
-  _api_version = 0
+# This vendored copy only ships the pure python implementation. The
+# _api_implementation module and the environment variable below would be those
+# of a protobuf installed on the system and must not switch this copy to its
+# compiled implementation (see compiled.py for using that one).
+_api_version = 0
 
 _default_implementation_type = (
     'python' if _api_version == 0 else 'cpp')
 _default_version_str = (
     '1' if _api_version <= 1 else '2')
 
-# This environment variable can be used to switch to a certain implementation
-# of the Python API, overriding the compile-time constants in the
-# _api_implementation module. Right now only 'python' and 'cpp' are valid
-# values. Any other value will be ignored.
-_implementation_type = os.getenv('PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION',
-                                 _default_implementation_type)
-
-if _implementation_type != 'python':
-  _implementation_type = 'cpp'
+_implementation_type = 'python'
 
 # This environment variable can be used to switch between the two
 # 'cpp' implementations, overriding the compile-time constants in the
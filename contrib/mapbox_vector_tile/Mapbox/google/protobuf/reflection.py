@@ -65,7 +65,7 @@ if api_implementation.Type() == 'cpp':
     _NewMessage = cpp_message.NewMessage
     _InitMessage = cpp_message.InitMessage
 else:
-  from google.protobuf.internal import python_message
+  from .internal import python_message
   _NewMessage = python_message.NewMessage
   _InitMessage = python_message.InitMessage
 
@@ -6,11 +6,35 @@ extents = 4096
 
 
 class Mapzen:
+    """
+     * A Mapzen decodes and encodes vector tiles.
+     >> Its TileData and protobuf message are reused by all the tiles it decodes, a Mapzen must therefore
+        only be used by one thread at a time.
+    """
 
-    def decode(self, tile):
-        vector_tile = decoder.TileData()
-        message = vector_tile.getMessage(tile)
-        return message
+    def __init__(self):
+        self._tile_data = decoder.TileData()
+
+    def decode(self, tile, flat=False, layers=None, keys=None, transform=None):
+        return self._tile_data.getMessage(tile, flat, layers, keys, transform)
+
+    def decode_many(self, tiles, flat=False, layers=None, keys=None, transform=None):
+        # decode the tiles one after the other, the decoded tiles are yielded in their order.
+        # tiles:: iterable of tile blobs or of (zoom, column, row, blob) tuples,
+        # for the tuples ((zoom, column, row), decoded tile) is yielded.
+        # transform:: function which returns the transform of the vertices (see TileData.getMessage)
+        # for (zoom, column, row), the vertices of the tuples are written transformed right away.
+        tile_data = self._tile_data
+        for tile in tiles:
+            if isinstance(tile, (tuple, list)):
+                key = tuple(tile[:3])
+                yield key, tile_data.getMessage(tile[3], flat, layers, keys, transform and transform(key))
+            else:
+                yield tile_data.getMessage(tile, flat, layers, keys)
+
+    def decode_lazy(self, tile, layers=None, keys=None):
+        # the layers of the tile as LayerViews, the features are only decoded when they are accessed.
+        return self._tile_data.getLayers(tile, layers, keys)
 
     def encode(self, layers):
         vector_tile = encoder.VectorTile(extents)
@@ -0,0 +1,35 @@
+from __future__ import absolute_import
+
+# the protobuf runtime installed on the system, it is only used if it is a compiled one (cpp or upb).
+# the runtime vendored in Mapbox/google is pure python.
+try:
+    from google.protobuf.internal import api_implementation
+    from google.protobuf import descriptor_pool, message_factory
+except ImportError:
+    api_implementation = None
+
+
+def implementation():
+    # the implementation of the protobuf runtime of the system, None if there is no compiled one
+    if api_implementation is None:
+        return None
+    kind = api_implementation.Type()
+    return kind if kind != "python" else None
+
+
+def message_class(serialized_file, full_name):
+    # the class of the message full_name, built by the compiled runtime from the serialized file descriptor.
+    # the descriptor is added to a pool of its own, so it does not clash with other users of the runtime.
+    # None if there is no compiled runtime or it can not build the class.
+    if implementation() is None:
+        return None
+    try:
+        pool = descriptor_pool.DescriptorPool()
+        pool.AddSerializedFile(serialized_file)
+        descriptor = pool.FindMessageTypeByName(full_name)
+        if hasattr(message_factory, "GetMessageClass"):
+            return message_factory.GetMessageClass(descriptor)
+        return message_factory.MessageFactory(pool).GetPrototype(descriptor)
+    except Exception:
+        # an unusable runtime must not keep the tiles from being decoded, the fallback is used instead.
+        return None
@@ -1,5 +1,13 @@
+from array import array
+from . import compiled
+from . import reader
 import sys
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 PY3 = sys.version_info[0] == 3
 
 if PY3:
@@ -9,50 +17,95 @@ else:
     from .Mapbox import vector_tile_pb2 as vector_tile
 
 cmd_bits = 3
+cmd_mask = (1 << cmd_bits) - 1
 
 CMD_MOVE_TO = 1
 CMD_LINE_TO = 2
 CMD_SEG_END = 7
 
+# layers with at least as many features are decoded at once with numpy, if it is available
+BULK_MIN_FEATURES = 64
+
+# the typecode of array for the transformed coordinates without numpy: 64 bit integers, 'l' has only 32 bits on
+# windows and python 2 has no 'q'. There the doubles hold them, they are exact up to 2 ** 53.
+COORDINATE_TYPECODE = "q" if PY3 else "l" if array("l").itemsize == 8 else "d"
+
+# the message class of the compiled protobuf runtime of the system, None if there is none
+compiled_tile = compiled.message_class(vector_tile.DESCRIPTOR.serialized_pb, "mapnik.vector.tile")
+
+# the tiles are read by the compiled protobuf runtime of the system (compiled) if there is one,
+# otherwise by the wire format reader (wire). the generated classes of the vendored pure python
+# runtime (protobuf) are the slowest, they are only used if asked for.
+default_backend = "compiled" if compiled_tile is not None else "wire"
+
 UNKNOWN = 0
 POINT = 1
 LINESTRING = 2
 POLYGON = 3
 
+# decoded values shared by all tiles, the same value of many tiles is kept only once.
+VALUE_CACHE_SIZE = 65536
+value_cache = {}
+
 
 class TileData:
     """
+     * TileData decodes the layers of a tile into plain python structures (getMessage) or lazy views (getLayers).
+     >> The tile is read by the backend: the compiled protobuf runtime of the system (compiled.py), the wire
+        format reader (reader.py), which decodes the fields directly from the bytes, or the generated classes
+        of the vendored protobuf runtime. All of them offer the same fields.
+     >> If numpy is available, the geometries of larger layers are decoded at once with array operations
+        (parse_layer_geometry, parse_layer_columns), otherwise feature by feature.
     """
-    def __init__(self):
-        self.tile = vector_tile.tile()
-
-    def getMessage(self, pbf_data):
-        self.tile.ParseFromString(pbf_data)
+    def __init__(self, backend=None):
+        self.backend = backend or default_backend
+        if self.backend == "compiled" and compiled_tile is None:
+            # there is no compiled runtime on this system
+            self.backend = "wire"
+        self.tile = self.new_message() if self.backend != "wire" else None
+        # the compiled runtime of python 2 returns the geometry integers as long
+        self._long_geometry = not PY3 and self.backend == "compiled"
 
+    def getMessage(self, pbf_data, flat=False, layers=None, keys=None, transform=None):
+        # with flat the geometries of a layer are returned as flat columns (see parse_geometry_flat)
+        # instead of nested lists in every feature.
+        # layers and keys are allow-lists of layer names and property keys, the others are skipped.
+        # transform:: (scale_x, offset_x, scale_y, offset_y), the vertices are written as
+        # (int(offset_x + scale_x * x), int(offset_y + scale_y * y)) instead of tile coordinates (see project).
         tile = {}
-        for layer in self.tile.layers:
-            keys = layer.keys
-            vals = layer.values
+        for layer in self.read_layers(pbf_data, reuse=True):
+            if layers is not None and layer.name not in layers:
+                continue
+            allowed = self.allowed_keys(layer, keys)
+            # both tables are decoded once, the tags of the features are indices into them.
+            keys_table = list(layer.keys)
+            vals = self.layer_values(layer)
 
             features = []
-            for feature in layer.features:
+            bulk = numpy is not None and len(layer.features) >= BULK_MIN_FEATURES
+            if flat:
+                columns = self.parse_layer_columns(layer, transform) if bulk else self.create_columns()
+            else:
+                geometries = self.parse_layer_geometry(layer, transform) if bulk else None
+            for index, feature in enumerate(layer.features):
                 tags = feature.tags
                 props = {}
                 assert len(tags) % 2 == 0, 'Unexpected number of tags'
                 for key_idx, val_idx in zip(tags[::2], tags[1::2]):
-                    key = keys[key_idx]
-                    val = vals[val_idx]
-                    value = self.parse_value(val)
-                    props[key] = value
+                    if allowed is not None and key_idx not in allowed:
+                        continue
+                    props[keys_table[key_idx]] = vals[val_idx]
 
-                geometry = self.parse_geometry(feature.geometry, feature.type,
-                                               layer.extent)
                 new_feature = {
-                    "geometry": geometry,
                     "properties": props,
                     "id": feature.id,
                     "type": feature.type
                 }
+                if not flat:
+                    new_feature["geometry"] = geometries[index] if bulk else \
+                        self.parse_geometry(self.feature_geometry(feature), feature.type, layer.extent, transform)
+                elif not bulk:
+                    self.parse_geometry_flat(feature.geometry, feature.type, layer.extent, columns)
                 features.append(new_feature)
 
             tile[layer.name] = {
@@ -60,91 +113,171 @@ class TileData:
                 "version": layer.version,
                 "features": features,
             }
+            if flat:
+                tile[layer.name]["columns"] = columns if bulk else self.finish_columns(columns, transform)
         return tile
 
-    def zero_pad(self, val):
-        return '0' + val if val[0] == 'b' else val
-
-    def parse_value(self, val):
-        for candidate in ('bool_value',
-                          'double_value',
-                          'float_value',
-                          'int_value',
-                          'sint_value',
-                          'string_value',
-                          'uint_value'):
-            if val.HasField(candidate):
-                return getattr(val, candidate)
-        raise ValueError('%s is an unknown value')
-
-    def zig_zag_decode(self, n):
-        return (n >> 1) ^ (-(n & 1))
-
-    def parse_geometry(self, geom, ftype, extent):
+    def getLayers(self, pbf_data, layers=None, keys=None):
+        # lazy variant of getMessage, returns a LayerView for every layer.
+        return dict((layer.name, LayerView(self, layer, self.allowed_keys(layer, keys)))
+                    for layer in self.read_layers(pbf_data) if layers is None or layer.name in layers)
+
+    def read_layers(self, pbf_data, reuse=False):
+        # read the layers of the tile with the backend.
+        # with reuse the protobuf message of the TileData is parsed again, its layers are only valid until the
+        # next call. otherwise the tile is parsed into its own message, e.g. for views which outlive the call.
+        if self.backend == "wire":
+            return reader.read_layers(pbf_data)
+        if self.backend == "protobuf" and not isinstance(pbf_data, bytes):
+            # the vendored runtime only parses bytes, the compiled one takes any buffer without copying it.
+            pbf_data = bytes(pbf_data)
+        tile = self.tile if reuse else self.new_message()
+        tile.ParseFromString(pbf_data)
+        return tile.layers
+
+    def new_message(self):
+        # an empty tile message of the backend
+        if self.backend == "compiled":
+            return compiled_tile()
+        return vector_tile.tile()
+
+    def feature_geometry(self, feature):
+        # the geometry integers of a feature, they are int for all the backends.
+        if self._long_geometry:
+            return map(int, feature.geometry)
+        return feature.geometry
+
+    def layer_values(self, layer):
+        # the decoded values table of a layer, the layers of the wire reader have decoded them already.
+        if self.backend == "wire":
+            return layer.values
+        return self.decode_values(layer.values)
+
+    def allowed_keys(self, layer, keys):
+        # the indices of the allowed keys in the keys table of the layer, None if all are allowed
+        if keys is None:
+            return None
+        return set(index for index, key in enumerate(layer.keys) if key in keys)
+
+    def create_columns(self):
+        # the flat geometry columns of a layer, in the style of geoarrow:
+        # coordinates:: x and y of all vertices of the layer, one after the other
+        # ring_offsets:: the vertices of ring r are ring_offsets[r] to ring_offsets[r + 1]
+        # part_offsets:: the rings of part p are part_offsets[p] to part_offsets[p + 1]
+        # geometry_offsets:: the parts of feature f are geometry_offsets[f] to geometry_offsets[f + 1]
+        # a part is a point sequence, a line string or a polygon (exterior ring followed by its interior rings).
+        # transformed coordinates (see getMessage) may exceed 32 bits, they are handed out as int64 or
+        # an array of COORDINATE_TYPECODE.
+        return {
+            "coordinates": array('i'),
+            "ring_offsets": array('i', [0]),
+            "part_offsets": array('i', [0]),
+            "geometry_offsets": array('i', [0]),
+        }
+
+    def finish_columns(self, columns, transform=None):
+        # hand out the columns as numpy arrays if numpy is available, they share the memory of the arrays.
+        # the coordinates are transformed at once, the rings were closed and assigned in tile coordinates.
+        if numpy is None:
+            if transform is not None:
+                scale_x, offset_x, scale_y, offset_y = transform
+                coords = array(COORDINATE_TYPECODE, columns["coordinates"])
+                coords[0::2] = array(COORDINATE_TYPECODE, (int(offset_x + scale_x * x) for x in coords[0::2]))
+                coords[1::2] = array(COORDINATE_TYPECODE, (int(offset_y + scale_y * y) for y in coords[1::2]))
+                columns["coordinates"] = coords
+            return columns
+        columns = dict((name, numpy.frombuffer(columns[name], dtype=numpy.int32)) for name in columns)
+        if transform is not None:
+            columns["coordinates"] = project(columns["coordinates"].reshape(-1, 2), transform).ravel()
+        return columns
+
+    def decode_values(self, values):
+        # decode the values table of a layer, a value message has exactly one of its fields set.
+        # equal values are taken from the shared value_cache.
+        if len(value_cache) > VALUE_CACHE_SIZE:
+            value_cache.clear()
+        decoded = []
+        for val in values:
+            fields = val.ListFields()
+            if not fields:
+                raise ValueError('%s is an unknown value' % val)
+            value = fields[0][1]
+            decoded.append(value_cache.setdefault((type(value), value), value))
+        return decoded
+
+    def parse_geometry(self, geom, ftype, extent, transform=None):
         # [9 0 8192 26 0 10 2 0 0 2 15]
+        # indexing a plain list is a lot cheaper than indexing the repeated field container.
+        # with a transform (see getMessage) the vertices are transformed right when they are decoded,
+        # rings are still closed by comparing their first and last vertex in tile coordinates.
+        geom = list(geom)
         i = 0
+        length = len(geom)
         coords = []
-        dx = 0
-        dy = 0
+        x = 0
+        y = 0
+        first_x = first_y = None  # the first vertex of coords in tile coordinates
+        if transform is not None:
+            scale_x, offset_x, scale_y, offset_y = transform
         parts = []  # for multi linestrings and multi polygons
+        is_polygon = ftype == POLYGON
+        is_multi = ftype == LINESTRING or is_polygon
 
-        while i != len(geom):
-            item = bin(geom[i])
-            ilen = len(item)
-            cmd = int(self.zero_pad(item[(ilen-cmd_bits):ilen]), 2)
-            cmd_len = int(self.zero_pad(item[:ilen-cmd_bits]), 2)
-
-            i = i + 1
-
-            def _ensure_polygon_closed(coords):
-                if coords and coords[0] != coords[-1]:
-                    coords.append(coords[0])
+        while i < length:
+            item = geom[i]
+            cmd = item & cmd_mask
+            cmd_len = item >> cmd_bits
+            i += 1
 
             if cmd == CMD_SEG_END:
-                if ftype == POLYGON:
-                    _ensure_polygon_closed(coords)
+                if is_polygon and coords and (first_x != x or first_y != y):
+                    coords.append(coords[0])
                 parts.append(coords)
                 coords = []
 
             elif cmd == CMD_MOVE_TO or cmd == CMD_LINE_TO:
 
-                if coords and cmd == CMD_MOVE_TO:
-                    if ftype in (LINESTRING, POLYGON):
-                        # multi line string or polygon
-                        # our encoder includes CMD_SEG_END to denote
-                        # the end of a polygon ring, but this path
-                        # would also handle the case where we receive
-                        # a move without a previous close on polygons
-
-                        # for polygons, we want to ensure that it is
-                        # closed
-                        if ftype == POLYGON:
-                            _ensure_polygon_closed(coords)
-                        parts.append(coords)
-                        coords = []
-
-                for point in xrange(0, cmd_len):
-                    x = geom[i]
-                    i = i + 1
-
-                    y = geom[i]
-                    i = i + 1
+                if coords and cmd == CMD_MOVE_TO and is_multi:
+                    # multi line string or polygon
+                    # our encoder includes CMD_SEG_END to denote
+                    # the end of a polygon ring, but this path
+                    # would also handle the case where we receive
+                    # a move without a previous close on polygons
 
-                    # zipzag decode
-                    x = self.zig_zag_decode(x)
-                    y = self.zig_zag_decode(y)
-
-                    x = x + dx
-                    y = y + dy
-
-                    dx = x
-                    dy = y
+                    # for polygons, we want to ensure that it is
+                    # closed
+                    if is_polygon and (first_x != x or first_y != y):
+                        coords.append(coords[0])
+                    parts.append(coords)
+                    coords = []
 
-                    coords.append([x, extent-y])
+                if not coords and cmd_len:
+                    dx = geom[i]
+                    dy = geom[i + 1]
+                    first_x = x + ((dx >> 1) ^ -(dx & 1))
+                    first_y = y + ((dy >> 1) ^ -(dy & 1))
+                end = i + 2 * cmd_len
+                if transform is None:
+                    while i < end:
+                        # zigzag decode and accumulate the deltas
+                        dx = geom[i]
+                        dy = geom[i + 1]
+                        x += (dx >> 1) ^ -(dx & 1)
+                        y += (dy >> 1) ^ -(dy & 1)
+                        coords.append([x, extent - y])
+                        i += 2
+                else:
+                    while i < end:
+                        dx = geom[i]
+                        dy = geom[i + 1]
+                        x += (dx >> 1) ^ -(dx & 1)
+                        y += (dy >> 1) ^ -(dy & 1)
+                        coords.append([int(offset_x + scale_x * x), int(offset_y + scale_y * (extent - y))])
+                        i += 2
 
         if ftype == POINT:
             return coords
-        elif ftype in (LINESTRING, POLYGON):
+        elif is_multi:
             if parts:
                 if coords:
                     parts.append(coords)
@@ -153,3 +286,362 @@ class TileData:
                 return coords
         else:
             raise ValueError('Unknown geometry type: %s' % ftype)
+
+    def decode_layer_geometry(self, layer):
+        # decode the vertices of all the features of a layer at once with numpy.
+        # the commands are found (_command_positions), then the parameters of all the commands are zigzag
+        # decoded, accumulated and flipped with array operations.
+        # returns the vertices as an array of x, y rows, the coordinate sequences as rows of
+        # (first vertex, end vertex, feature), split like parse_geometry splits them, and the number of
+        # sequences of every feature. the last sequence of a feature is the one which no command ended.
+        features = layer.features
+        types = numpy.array([feature.type for feature in features], dtype=numpy.int64)
+        unknown = (types < POINT) | (types > POLYGON)
+        if unknown.any():
+            raise ValueError('Unknown geometry type: %s' % types[unknown][0])
+        values, lengths = self._geometry_integers(layer)
+        ends = numpy.cumsum(lengths)
+        starts = ends - lengths
+        positions = self._command_positions(values, starts, ends)
+        items = values[positions]
+        cmds = items & cmd_mask
+        counts = numpy.where((cmds == CMD_MOVE_TO) | (cmds == CMD_LINE_TO), items >> cmd_bits, 0)
+        mask = numpy.ones(len(values), dtype=bool)
+        mask[positions] = False
+        params = values[mask]
+        deltas = (params >> 1) ^ -(params & 1)
+
+        # the vertex of every command, the first and the end vertex of every feature
+        passed = numpy.append(0, numpy.cumsum(counts))
+        first_vertices = passed[numpy.searchsorted(positions, starts)]
+        end_vertices = passed[numpy.searchsorted(positions, ends)]
+        # the cursor starts at 0, 0 for every feature, the sum of the deltas of the previous feature
+        # is subtracted from the first delta of a feature before they are accumulated.
+        deltas = deltas.reshape(-1, 2)
+        firsts = first_vertices[first_vertices < end_vertices]
+        if len(firsts) > 1:
+            deltas[firsts[1:]] -= numpy.add.reduceat(deltas, firsts, axis=0)[:-1]
+        xy = numpy.cumsum(deltas, axis=0)
+        xy[:, 1] = layer.extent - xy[:, 1]
+
+        # a sequence is ended by a close path and (for lines and polygons) by a move to, if it is not empty
+        owners = numpy.searchsorted(ends, positions, side="right")
+        ending = (cmds == CMD_SEG_END) | ((cmds == CMD_MOVE_TO) & (types[owners] != POINT))
+        vertices = passed[:-1][ending]
+        owners = owners[ending]
+        previous = first_vertices[owners]
+        same = numpy.zeros(len(owners), dtype=bool)
+        same[1:] = owners[1:] == owners[:-1]
+        previous[same] = vertices[:-1][same[1:]]
+        kept = (cmds[ending] == CMD_SEG_END) | (vertices > previous)
+        # every feature ends with the sequence which is still open
+        last_vertices = first_vertices.copy()
+        last = numpy.ones(len(owners), dtype=bool)
+        last[:-1] = ~same[1:]
+        last_vertices[owners[last]] = vertices[last]
+        pieces = numpy.concatenate((
+            numpy.column_stack((previous[kept], vertices[kept], owners[kept])),
+            numpy.column_stack((last_vertices, end_vertices, numpy.arange(len(features))))))
+        pieces = pieces[numpy.argsort(pieces[:, 2], kind="mergesort")]
+        return xy, pieces, numpy.bincount(pieces[:, 2], minlength=len(features))
+
+    def _command_positions(self, values, starts, ends):
+        # the positions of the command integers in the geometry integers of the features.
+        # every round steps over one command of every feature which has not reached its end yet,
+        # the features which are left over for many rounds are walked in python.
+        found = []
+        active = starts < ends
+        current, ends = starts[active], ends[active]
+        while len(current) >= BULK_MIN_FEATURES:
+            found.append(current)
+            items = values[current]
+            cmds = items & cmd_mask
+            current = current + 1 + numpy.where((cmds == CMD_MOVE_TO) | (cmds == CMD_LINE_TO),
+                                                2 * (items >> cmd_bits), 0)
+            if (current > ends).any():
+                raise ValueError('Geometry is missing parameters')
+            active = current < ends
+            current, ends = current[active], ends[active]
+        if len(current):
+            geom = values.tolist()
+            rest = []
+            for i, end in zip(current.tolist(), ends.tolist()):
+                while i < end:
+                    item = geom[i]
+                    cmd = item & cmd_mask
+                    rest.append(i)
+                    i += 1
+                    if cmd == CMD_MOVE_TO or cmd == CMD_LINE_TO:
+                        i += 2 * (item >> cmd_bits)
+                if i > end:
+                    raise ValueError('Geometry is missing parameters')
+            found.append(numpy.array(rest, dtype=numpy.int64))
+        if not found:
+            return numpy.zeros(0, dtype=numpy.int64)
+        positions = numpy.concatenate(found)
+        positions.sort()
+        return positions
+
+    def parse_layer_geometry(self, layer, transform=None):
+        # the geometries of all the features of a layer like parse_geometry returns them,
+        # the vertices are decoded (decode_layer_geometry) and transformed at once.
+        if not layer.features:
+            return []
+        xy, pieces, counts = self.decode_layer_geometry(layer)
+        # the sequences which are not closed yet, compared in tile coordinates
+        filled = pieces[:, 1] > pieces[:, 0]
+        opened = numpy.zeros(len(pieces), dtype=bool)
+        opened[filled] = (xy[pieces[filled, 0]] != xy[pieces[filled, 1] - 1]).any(axis=1)
+        coords = (xy if transform is None else project(xy, transform)).tolist()
+        opened = opened.tolist()
+        firsts = pieces[:, 0].tolist()
+        lasts = pieces[:, 1].tolist()
+        geometries = []
+        index = 0
+        for feature, count in zip(layer.features, counts.tolist()):
+            # the open sequence is the last one of the feature
+            open_index = index + count - 1
+            if feature.type == POINT or count == 1:
+                geometries.append(coords[firsts[open_index]:lasts[open_index]])
+            else:
+                rings = []
+                for ring_index in xrange(index, open_index):
+                    ring = coords[firsts[ring_index]:lasts[ring_index]]
+                    if feature.type == POLYGON and opened[ring_index]:
+                        ring.append(ring[0])
+                    rings.append(ring)
+                if lasts[open_index] > firsts[open_index]:
+                    rings.append(coords[firsts[open_index]:lasts[open_index]])
+                geometries.append(rings[0] if len(rings) == 1 else rings)
+            index += count
+        return geometries
+
+    def parse_layer_columns(self, layer, transform=None):
+        # the flat geometry columns of a layer like parse_geometry_flat builds them feature by feature,
+        # the vertices are decoded at once (decode_layer_geometry) and the columns built with array operations.
+        if not layer.features:
+            return self.finish_columns(self.create_columns())
+        xy, pieces, counts = self.decode_layer_geometry(layer)
+        # every sequence which is not empty is a ring
+        rings = pieces[pieces[:, 1] > pieces[:, 0]]
+        firsts, lasts, owners = rings[:, 0], rings[:, 1], rings[:, 2]
+        polygons = numpy.array([feature.type == POLYGON for feature in layer.features], dtype=bool)[owners]
+        # polygon rings are closed, if their last vertex is not their first one
+        closing = polygons & (xy[firsts] != xy[lasts - 1]).any(axis=1)
+        sizes = lasts - firsts + closing
+        ring_offsets = numpy.append(0, numpy.cumsum(sizes))
+        indices = numpy.arange(ring_offsets[-1]) + numpy.repeat(firsts - ring_offsets[:-1], sizes)
+        indices[ring_offsets[1:][closing] - 1] = firsts[closing]
+        coords = xy[indices]
+        # twice the signed area of every ring, y is flipped, exterior rings have a negative area now
+        terms = coords[:-1, 0] * coords[1:, 1] - coords[1:, 0] * coords[:-1, 1]
+        terms[ring_offsets[1:-1] - 1] = 0
+        areas = numpy.add.reduceat(numpy.append(terms, 0), ring_offsets[:-1]) if len(rings) else terms
+        # a part starts with the first ring of a feature, every line string and every exterior ring
+        starts = numpy.ones(len(rings), dtype=bool)
+        starts[1:] = (owners[1:] != owners[:-1]) | ~polygons[1:] | (areas[1:] < 0)
+        parts = numpy.bincount(owners[starts], minlength=len(layer.features))
+        coords = coords.astype(numpy.int32) if transform is None else project(coords, transform)
+        return {
+            "coordinates": coords.ravel(),
+            "ring_offsets": ring_offsets.astype(numpy.int32),
+            "part_offsets": numpy.append(numpy.flatnonzero(starts), len(rings)).astype(numpy.int32),
+            "geometry_offsets": numpy.append(0, numpy.cumsum(parts)).astype(numpy.int32),
+        }
+
+    def _geometry_integers(self, layer):
+        # returns the geometry integers of all the features of a layer, one after the other,
+        # and the number of integers of every feature.
+        # the packed geometries located by the wire reader are decoded with numpy straight from the buffer.
+        features = layer.features
+        if self.backend != "wire" or any(feature.geometry_span is None for feature in features):
+            geom = []
+            for feature in features:
+                geom.extend(feature.geometry)
+            return numpy.array(geom, dtype=numpy.int64), \
+                numpy.array([len(feature.geometry) for feature in features], dtype=numpy.int64)
+        spans = numpy.array([feature.geometry_span for feature in features], dtype=numpy.int64).reshape(-1, 2)
+        lengths = spans[:, 1] - spans[:, 0]
+        offsets = numpy.cumsum(lengths) - lengths
+        if not len(spans) or not lengths.any():
+            return numpy.zeros(0, dtype=numpy.int64), lengths
+        # the bytes of all the spans, one span after the other. the spans are marked in the bytes of the layer.
+        low_end, high_end = spans[:, 0].min(), spans[:, 1].max()
+        marks = numpy.zeros(high_end - low_end + 1, dtype=numpy.int8)
+        marks[spans[:, 0] - low_end] += 1
+        marks[spans[:, 1] - low_end] -= 1
+        inside = numpy.cumsum(marks[:-1], dtype=numpy.int8).view(bool)
+        data = numpy.frombuffer(layer.buffer, dtype=numpy.uint8)[low_end:high_end][inside]
+        # the last byte of a varint has no continuation bit, it holds the most significant bits.
+        # the bytes before it are added for the varints which have more than one byte, mostly there are few.
+        ends = numpy.flatnonzero(data < 0x80)
+        firsts = numpy.append(0, ends[:-1] + 1)
+        low = (data & 0x7f).astype(numpy.int64)
+        geom = low[ends]
+        varints = numpy.flatnonzero(ends != firsts)
+        before = ends[varints] - 1
+        while len(varints):
+            geom[varints] = (geom[varints] << 7) | low[before]
+            more = before > firsts[varints]
+            varints, before = varints[more], before[more] - 1
+        # the number of varints which end in the span of every feature
+        return geom, numpy.searchsorted(ends, offsets + lengths) - numpy.searchsorted(ends, offsets)
+
+    def parse_geometry_flat(self, geom, ftype, extent, columns):
+        # decode the geometry like parse_geometry, but append it to the flat columns of the layer.
+        # the rings of a polygon are assigned to their parts by their winding order.
+        geom = list(geom)
+        coords = columns["coordinates"]
+        ring_offsets = columns["ring_offsets"]
+        part_offsets = columns["part_offsets"]
+        i = 0
+        length = len(geom)
+        x = 0
+        y = 0
+        start = len(coords)  # first value of the current ring
+        is_polygon = ftype == POLYGON
+        is_multi = ftype == LINESTRING or is_polygon
+        open_part = False
+
+        while i <= length:
+            if i < length:
+                item = geom[i]
+                cmd = item & cmd_mask
+                cmd_len = item >> cmd_bits
+                i += 1
+            else:
+                # end of the geometry, the last ring is ended as well
+                cmd = CMD_SEG_END
+                i += 1
+
+            ends_ring = cmd == CMD_SEG_END or (cmd == CMD_MOVE_TO and is_multi)
+            if ends_ring and len(coords) > start:
+                new_part = True
+                if is_polygon:
+                    if coords[start] != coords[-2] or coords[start + 1] != coords[-1]:
+                        coords.append(coords[start])
+                        coords.append(coords[start + 1])
+                    # y is flipped, exterior rings have a negative area now
+                    new_part = not open_part or self._ring_area(coords, start) < 0
+                if new_part and open_part:
+                    part_offsets.append(len(ring_offsets) - 1)
+                open_part = True
+                ring_offsets.append(len(coords) // 2)
+                start = len(coords)
+
+            if cmd == CMD_MOVE_TO or cmd == CMD_LINE_TO:
+                end = i + 2 * cmd_len
+                while i < end:
+                    dx = geom[i]
+                    dy = geom[i + 1]
+                    x += (dx >> 1) ^ -(dx & 1)
+                    y += (dy >> 1) ^ -(dy & 1)
+                    coords.append(x)
+                    coords.append(extent - y)
+                    i += 2
+
+        if ftype not in (POINT, LINESTRING, POLYGON):
+            raise ValueError('Unknown geometry type: %s' % ftype)
+        if open_part:
+            part_offsets.append(len(ring_offsets) - 1)
+        columns["geometry_offsets"].append(len(part_offsets) - 1)
+
+    def _ring_area(self, coords, start):
+        # twice the signed area of the ring starting at start, using the surveyor's formula
+        area = 0
+        for j in xrange(start, len(coords) - 2, 2):
+            area += coords[j] * coords[j + 3] - coords[j + 2] * coords[j + 1]
+        return area
+
+
+class LayerView(object):
+    """
+     * A LayerView wraps a decoded layer message, its features are FeatureViews.
+     >> The keys and values tables of the layer are only decoded when the first feature needs them (key, value).
+    """
+    __slots__ = ("name", "extent", "version", "features", "allowed", "_decoder", "_layer", "_keys", "_values")
+
+    def __init__(self, decoder, layer, allowed=None):
+        # allowed:: indices of the keys which are part of the properties, None for all keys
+        self._decoder = decoder
+        self._layer = layer
+        self._keys = None
+        self._values = None
+        self.allowed = allowed
+        self.name = layer.name
+        self.extent = layer.extent
+        self.version = layer.version
+        self.features = [FeatureView(self, feature) for feature in layer.features]
+
+    def __len__(self):
+        return len(self.features)
+
+    def __iter__(self):
+        return iter(self.features)
+
+    def key(self, index):
+        if self._keys is None:
+            self._keys = list(self._layer.keys)
+        return self._keys[index]
+
+    def value(self, index):
+        if self._values is None:
+            self._values = self._decoder.layer_values(self._layer)
+        return self._values[index]
+
+
+class FeatureView(object):
+    """
+     * A FeatureView wraps a decoded feature message.
+     >> id and type are read right away, they are plain fields of the message.
+     >> The tags are resolved on the first access of properties, the geometry commands are decoded
+        on the first access of geometry. Both are memoized.
+    """
+    __slots__ = ("id", "type", "_layer", "_feature", "_properties", "_geometry")
+
+    def __init__(self, layer, feature):
+        self._layer = layer
+        self._feature = feature
+        self._properties = None
+        self._geometry = None
+        self.id = feature.id
+        self.type = feature.type
+
+    @property
+    def properties(self):
+        if self._properties is None:
+            tags = self._feature.tags
+            assert len(tags) % 2 == 0, 'Unexpected number of tags'
+            layer = self._layer
+            allowed = layer.allowed
+            self._properties = dict((layer.key(key_idx), layer.value(val_idx))
+                                    for key_idx, val_idx in zip(tags[::2], tags[1::2])
+                                    if allowed is None or key_idx in allowed)
+        return self._properties
+
+    @property
+    def geometry(self):
+        if self._geometry is None:
+            decoder = self._layer._decoder
+            self._geometry = decoder.parse_geometry(decoder.feature_geometry(self._feature), self.type,
+                                                    self._layer.extent)
+        return self._geometry
+
+
+def project(xy, transform):
+    # the vertices of an array of x, y rows after the affine transform (see TileData.getMessage).
+    # the result is the same as of int() on every vertex, the conversion truncates towards zero as well.
+    scale_x, offset_x, scale_y, offset_y = transform
+    projected = xy * (scale_x, scale_y)
+    projected += (offset_x, offset_y)
+    return projected.astype(numpy.int64)
+
+
+def backend_description(backend=None):
+    # a description of the backend (default_backend if None) for the user
+    backend = backend or default_backend
+    if backend == "compiled":
+        return "compiled protobuf runtime (%s)" % compiled.implementation()
+    if backend == "wire":
+        return "wire format reader"
+    return "vendored pure python protobuf runtime"
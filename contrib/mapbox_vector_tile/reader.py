@@ -0,0 +1,255 @@
+import struct
+import sys
+
+PY3 = sys.version_info[0] == 3
+
+if PY3:
+    def _text(data):
+        return str(data, "utf-8")
+else:
+    def _text(data):
+        # the buffer is a bytearray in python 2
+        return data.decode("utf-8")
+
+# wire types of the protobuf encoding
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH = 2
+WIRE_FIXED32 = 5
+
+# decoded values shared by all tiles, keyed by the raw bytes of the value message.
+RAW_VALUE_CACHE_SIZE = 65536
+raw_value_cache = {}
+
+_float = struct.Struct("<f")
+_double = struct.Struct("<d")
+
+
+def read_layers(data):
+    # read the layers of a vector tile directly from the protobuf wire format.
+    # data:: bytes, bytearray or any other buffer of the uncompressed tile
+    if not PY3:
+        if not isinstance(data, bytearray):
+            # indexing a str, buffer or memoryview of python 2 returns characters, not integers
+            data = bytearray(data)
+    elif not isinstance(data, (bytes, bytearray)):
+        data = memoryview(data)
+        if isinstance(data.obj, bytes) and data.nbytes == len(data.obj):
+            # a view of a whole bytes object, which is indexed faster than the view
+            data = data.obj
+        elif data.format != "B" or data.ndim != 1:
+            data = data.cast("B")
+    layers = []
+    pos = 0
+    end = len(data)
+    while pos < end:
+        key, pos = read_varint(data, pos)
+        if key == (3 << 3 | WIRE_LENGTH):
+            length, pos = read_varint(data, pos)
+            layers.append(Layer(data, pos, pos + length))
+            pos += length
+        else:
+            pos = skip_field(data, pos, key & 7)
+    return layers
+
+
+def read_varint(buf, pos):
+    # returns the varint at pos and the position after it
+    byte = buf[pos]
+    pos += 1
+    if byte < 0x80:
+        return byte, pos
+    value = byte & 0x7f
+    shift = 7
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def read_packed(buf, pos, end, values):
+    # append the packed varints between pos and end to values
+    append = values.append
+    while pos < end:
+        byte = buf[pos]
+        pos += 1
+        if byte < 0x80:
+            append(byte)
+            continue
+        value = byte & 0x7f
+        shift = 7
+        while True:
+            byte = buf[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        append(value)
+    return values
+
+
+def skip_field(buf, pos, wire_type):
+    # returns the position after the value of an unknown field
+    if wire_type == WIRE_VARINT:
+        return read_varint(buf, pos)[1]
+    if wire_type == WIRE_FIXED64:
+        return pos + 8
+    if wire_type == WIRE_LENGTH:
+        length, pos = read_varint(buf, pos)
+        return pos + length
+    if wire_type == WIRE_FIXED32:
+        return pos + 4
+    raise ValueError('Unsupported wire type: %s' % wire_type)
+
+
+def read_value(buf, pos, end):
+    # decode a value message, exactly one of its fields is set
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        field = key >> 3
+        if field == 1:
+            length, pos = read_varint(buf, pos)
+            return _text(buf[pos:pos + length])
+        if field == 2:
+            return _float.unpack(bytes(buf[pos:pos + 4]))[0]
+        if field == 3:
+            return _double.unpack(bytes(buf[pos:pos + 8]))[0]
+        if 4 <= field <= 7:
+            value = read_varint(buf, pos)[0]
+            if field == 4:
+                return value - (1 << 64) if value >= 1 << 63 else value
+            if field == 6:
+                return (value >> 1) ^ -(value & 1)
+            if field == 7:
+                return bool(value)
+            return value
+        pos = skip_field(buf, pos, key & 7)
+    raise ValueError('%r is an unknown value' % bytes(buf[pos:end]))
+
+
+class Layer(object):
+    """
+     * A Layer reads a layer message of the tile, it offers the same fields as the generated protobuf class.
+     >> name, version, extent and keys are read right away.
+     >> The features and values are only located; they are decoded on the first access of features and values.
+     >> The values are decoded already, no value message has to be inspected anymore. Equal value messages
+        of all tiles are decoded once (raw_value_cache).
+    """
+    __slots__ = ("name", "version", "extent", "keys", "buffer", "_feature_spans", "_value_spans",
+                 "_features", "_values")
+
+    def __init__(self, buf, pos, end):
+        self.buffer = buf  # the tile, the spans of the features refer to it
+        self._feature_spans = []
+        self._value_spans = []
+        self._features = None
+        self._values = None
+        self.name = u""
+        self.version = 1
+        self.extent = 4096
+        self.keys = []
+        while pos < end:
+            key, pos = read_varint(buf, pos)
+            field = key >> 3
+            if key & 7 == WIRE_LENGTH:
+                length, pos = read_varint(buf, pos)
+                if field == 2:
+                    self._feature_spans.append((pos, pos + length))
+                elif field == 4:
+                    self._value_spans.append((pos, pos + length))
+                elif field == 3:
+                    self.keys.append(_text(buf[pos:pos + length]))
+                elif field == 1:
+                    self.name = _text(buf[pos:pos + length])
+                pos += length
+            elif field == 15 and key & 7 == WIRE_VARINT:
+                self.version, pos = read_varint(buf, pos)
+            elif field == 5 and key & 7 == WIRE_VARINT:
+                self.extent, pos = read_varint(buf, pos)
+            else:
+                pos = skip_field(buf, pos, key & 7)
+
+    @property
+    def features(self):
+        if self._features is None:
+            buf = self.buffer
+            self._features = [Feature(buf, start, end) for start, end in self._feature_spans]
+        return self._features
+
+    @property
+    def values(self):
+        if self._values is None:
+            if len(raw_value_cache) > RAW_VALUE_CACHE_SIZE:
+                raw_value_cache.clear()
+            buf = self.buffer
+            values = []
+            for start, end in self._value_spans:
+                raw = bytes(buf[start:end])
+                try:
+                    value = raw_value_cache[raw]
+                except KeyError:
+                    value = raw_value_cache[raw] = read_value(buf, start, end)
+                values.append(value)
+            self._values = values
+        return self._values
+
+
+class Feature(object):
+    """
+     * A Feature reads a feature message, the packed tags are decoded into a list of integers.
+     >> The packed geometry is only located (geometry_span), it is decoded on the first access of geometry.
+        The span lets the geometries of a whole layer be decoded at once, straight from the buffer.
+    """
+    __slots__ = ("id", "type", "tags", "geometry_span", "_buffer", "_geometry")
+
+    def __init__(self, buf, pos, end):
+        self._buffer = buf
+        self._geometry = None
+        self.geometry_span = None  # (start, end) in the buffer, None if the geometry is not a single packed field
+        self.id = 0
+        self.type = 0
+        self.tags = []
+        while pos < end:
+            key, pos = read_varint(buf, pos)
+            if key == (4 << 3 | WIRE_LENGTH):
+                length, pos = read_varint(buf, pos)
+                if self.geometry_span is None and self._geometry is None:
+                    self.geometry_span = (pos, pos + length)
+                else:
+                    read_packed(buf, pos, pos + length, self._materialize())
+                pos += length
+            elif key == (2 << 3 | WIRE_LENGTH):
+                length, pos = read_varint(buf, pos)
+                read_packed(buf, pos, pos + length, self.tags)
+                pos += length
+            elif key == (3 << 3 | WIRE_VARINT):
+                self.type, pos = read_varint(buf, pos)
+            elif key == (1 << 3 | WIRE_VARINT):
+                self.id, pos = read_varint(buf, pos)
+            elif key == (4 << 3 | WIRE_VARINT):
+                # repeated fields may also be written unpacked
+                value, pos = read_varint(buf, pos)
+                self._materialize().append(value)
+            elif key == (2 << 3 | WIRE_VARINT):
+                value, pos = read_varint(buf, pos)
+                self.tags.append(value)
+            else:
+                pos = skip_field(buf, pos, key & 7)
+
+    @property
+    def geometry(self):
+        if self._geometry is None:
+            self._geometry = []
+            if self.geometry_span is not None:
+                read_packed(self._buffer, self.geometry_span[0], self.geometry_span[1], self._geometry)
+        return self._geometry
+
+    def _materialize(self):
+        # the geometry is split into several fields, it is decoded into the list right away.
+        geometry = self.geometry
+        self.geometry_span = None
+        return geometry
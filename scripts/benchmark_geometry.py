@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+""" THIS COMMENT MUST NOT REMAIN INTACT
+
+GNU GENERAL PUBLIC LICENSE
+
+Copyright (c) 2015 geometalab HSR
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+"""
+
+# times the decoding of the geometry commands of the z14 building and road layers of the test tile,
+# run it from the directory of the plugin:
+#   python scripts/benchmark_geometry.py [tile file]
+# parse_geometry of the decoder is compared with the decoder before the commands were decoded with integer
+# arithmetic (old_parse_geometry), which formatted every command with bin(). If numpy is available,
+# the decoding of whole layers at once (parse_layer_geometry) is timed as well, it includes reading the
+# geometry integers from the tile.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contrib.mapbox_vector_tile import decoder
+
+TILE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "data",
+                         "test_tile.pbf")
+LAYERS = ["building", "transportation"]
+REPEAT = 5
+
+if sys.version_info[0] == 3:
+    xrange = range
+
+
+def old_parse_geometry(geom, ftype, extent):
+    # the geometry decoding of the decoder before, only the helpers are functions instead of methods
+    i = 0
+    coords = []
+    dx = 0
+    dy = 0
+    parts = []  # for multi linestrings and multi polygons
+
+    while i != len(geom):
+        item = bin(geom[i])
+        ilen = len(item)
+        cmd = int(_zero_pad(item[(ilen - decoder.cmd_bits):ilen]), 2)
+        cmd_len = int(_zero_pad(item[:ilen - decoder.cmd_bits]), 2)
+
+        i = i + 1
+
+        def _ensure_polygon_closed(coords):
+            if coords and coords[0] != coords[-1]:
+                coords.append(coords[0])
+
+        if cmd == decoder.CMD_SEG_END:
+            if ftype == decoder.POLYGON:
+                _ensure_polygon_closed(coords)
+            parts.append(coords)
+            coords = []
+
+        elif cmd == decoder.CMD_MOVE_TO or cmd == decoder.CMD_LINE_TO:
+
+            if coords and cmd == decoder.CMD_MOVE_TO:
+                if ftype in (decoder.LINESTRING, decoder.POLYGON):
+                    if ftype == decoder.POLYGON:
+                        _ensure_polygon_closed(coords)
+                    parts.append(coords)
+                    coords = []
+
+            for point in xrange(0, cmd_len):
+                x = geom[i]
+                i = i + 1
+
+                y = geom[i]
+                i = i + 1
+
+                x = _zig_zag_decode(x)
+                y = _zig_zag_decode(y)
+
+                x = x + dx
+                y = y + dy
+
+                dx = x
+                dy = y
+
+                coords.append([x, extent - y])
+
+    if ftype == decoder.POINT:
+        return coords
+    elif ftype in (decoder.LINESTRING, decoder.POLYGON):
+        if parts:
+            if coords:
+                parts.append(coords)
+            return parts[0] if len(parts) == 1 else parts
+        else:
+            return coords
+    else:
+        raise ValueError('Unknown geometry type: %s' % ftype)
+
+
+def _zero_pad(val):
+    return '0' + val if val[0] == 'b' else val
+
+
+def _zig_zag_decode(n):
+    return (n >> 1) ^ (-(n & 1))
+
+
+def best_time(function):
+    # the shortest of REPEAT runs in seconds
+    best = None
+    for run in range(REPEAT):
+        start = time.time()
+        function()
+        duration = time.time() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+def main(tile_file):
+    with open(tile_file, "rb") as f:
+        data = f.read()
+    tile_data = decoder.TileData("wire")
+    layers = [layer for layer in tile_data.read_layers(data) if layer.name in LAYERS]
+    # the features and their geometry integers are read before, only the commands are timed
+    features = [(list(feature.geometry), feature.type, layer.extent)
+                for layer in layers for feature in layer.features]
+    vertices = sum(len(geometry) for geometry, geo_type, extent in features) // 2
+
+    def run_old():
+        return [old_parse_geometry(geometry, geo_type, extent) for geometry, geo_type, extent in features]
+
+    def run_new():
+        return [tile_data.parse_geometry(geometry, geo_type, extent) for geometry, geo_type, extent in features]
+
+    print("%s features with about %s vertices of the layers %s" % (len(features), vertices, ", ".join(LAYERS)))
+    if run_old() != run_new():
+        print("the geometries of parse_geometry differ from the old decoder")
+    old = best_time(run_old)
+    new = best_time(run_new)
+    print("old decoder:         %8.2f ms" % (old * 1000))
+    print("parse_geometry:      %8.2f ms (%.1fx)" % (new * 1000, old / new))
+    if decoder.numpy is not None:
+        bulk = best_time(lambda: [tile_data.parse_layer_geometry(layer) for layer in layers])
+        print("parse_layer_geometry:%8.2f ms (%.1fx)" % (bulk * 1000, old / bulk))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else TILE_FILE)
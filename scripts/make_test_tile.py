@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+""" THIS COMMENT MUST NOT REMAIN INTACT
+
+GNU GENERAL PUBLIC LICENSE
+
+Copyright (c) 2015 geometalab HSR
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+"""
+
+# writes the vector tile of the tests (test/data/test_tile.pbf), run it from the directory of the plugin:
+#   python scripts/make_test_tile.py
+# the tile looks like a z14 tile of OpenMapTiles: building (polygons, some with holes or several parts),
+# transportation (lines and multi lines) and poi (points and multi points). The layer edge holds the
+# extreme values of all value types and odd geometries (empty, unclosed, single vertex, huge deltas).
+# the tile is the same on every run, the random numbers have a fixed seed.
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contrib.mapbox_vector_tile import decoder
+
+EXTENT = 4096
+FILE_NAME = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "data", "test_tile.pbf")
+
+
+class LayerWriter:
+    """
+     * A LayerWriter adds features to a layer message, it keeps the keys and values tables free of duplicates.
+     >> The geometries are given as parts of vertices in tile coordinates, they are encoded into commands (_encode).
+    """
+
+    def __init__(self, tile, name):
+        self.layer = tile.layers.add()
+        self.layer.name = name
+        self.layer.version = 2
+        self.layer.extent = EXTENT
+        self._keys = {}
+        self._values = {}
+
+    def add(self, geo_type, parts, properties=(), feature_id=None, close=True):
+        # parts:: list of vertex lists, a polygon ring without its closing vertex
+        # properties:: list of (key, value field, value)
+        feature = self.layer.features.add()
+        feature.type = geo_type
+        if feature_id is not None:
+            feature.id = feature_id
+        for key, field, value in properties:
+            feature.tags.extend([self._key(key), self._value(field, value)])
+        feature.geometry.extend(_encode(geo_type, parts, close))
+        return feature
+
+    def _key(self, key):
+        if key not in self._keys:
+            self._keys[key] = len(self.layer.keys)
+            self.layer.keys.append(key)
+        return self._keys[key]
+
+    def _value(self, field, value):
+        if (field, value) not in self._values:
+            self._values[(field, value)] = len(self.layer.values)
+            setattr(self.layer.values.add(), field, value)
+        return self._values[(field, value)]
+
+
+def _command(command, count):
+    return (command & 7) | (count << 3)
+
+
+def _zig_zag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _encode(geo_type, parts, close=True):
+    # the commands of the parts, the cursor moves on from the last vertex of the previous part
+    commands = []
+    x = y = 0
+    if geo_type == decoder.POINT and parts:
+        commands.append(_command(decoder.CMD_MOVE_TO, sum(len(part) for part in parts)))
+    for part in parts:
+        for index, (px, py) in enumerate(part):
+            if geo_type != decoder.POINT and index < 2:
+                commands.append(_command(decoder.CMD_MOVE_TO if index == 0 else decoder.CMD_LINE_TO,
+                                         1 if index == 0 else len(part) - 1))
+            commands.extend([_zig_zag(px - x), _zig_zag(py - y)])
+            x, y = px, py
+        if geo_type == decoder.POLYGON and close:
+            commands.append(_command(decoder.CMD_SEG_END, 1))
+    return commands
+
+
+def _rectangle(x, y, width, height, clockwise=True):
+    # a ring of the rectangle, exterior rings are clockwise in tile coordinates (y points down)
+    ring = [(x, y), (x + width, y), (x + width, y + height), (x, y + height)]
+    return ring if clockwise else ring[::-1]
+
+
+def _building(random_numbers, writer, index):
+    x = random_numbers.randint(-64, EXTENT - 64)
+    y = random_numbers.randint(-64, EXTENT - 64)
+    width = random_numbers.randint(8, 120)
+    height = random_numbers.randint(8, 120)
+    parts = [_rectangle(x, y, width, height)]
+    if index % 7 == 0:
+        # a courtyard
+        parts.append(_rectangle(x + width // 4, y + height // 4, width // 2, height // 2, clockwise=False))
+    if index % 11 == 0:
+        # a second polygon
+        parts.append(_rectangle(x + width + 10, y, width // 2 + 1, height))
+    properties = [("render_height", "int_value", random_numbers.randint(3, 120)),
+                  ("render_min_height", "uint_value", random_numbers.choice([0, 0, 3, 6]))]
+    if index % 5 == 0:
+        properties.append(("colour", "string_value", random_numbers.choice([u"#d9d0c9", u"#bfb7b0"])))
+    writer.add(decoder.POLYGON, parts, properties, feature_id=index * 10 + 1)
+
+
+def _road(random_numbers, writer, index):
+    lines = []
+    for part in range(2 if index % 9 == 0 else 1):
+        x = random_numbers.randint(-128, EXTENT + 128)
+        y = random_numbers.randint(-128, EXTENT + 128)
+        line = [(x, y)]
+        for vertex in range(random_numbers.randint(1, 30)):
+            x += random_numbers.randint(-300, 300)
+            y += random_numbers.randint(-300, 300)
+            line.append((x, y))
+        lines.append(line)
+    properties = [("class", "string_value", random_numbers.choice([u"primary", u"minor", u"path", u"service"])),
+                  ("layer", "sint_value", random_numbers.randint(-2, 2)),
+                  ("oneway", "bool_value", index % 3 == 0),
+                  ("ratio", "float_value", random_numbers.choice([0.5, 1.25, -3.75]))]
+    writer.add(decoder.LINESTRING, lines, properties, feature_id=index * 10 + 2)
+
+
+def _poi(random_numbers, writer, index):
+    points = [(random_numbers.randint(0, EXTENT), random_numbers.randint(0, EXTENT))
+              for point in range(3 if index % 8 == 0 else 1)]
+    properties = [("name", "string_value", random_numbers.choice([u"Zürich HB", u"Bäckerei", u"", u"東京"])),
+                  ("rank", "uint_value", random_numbers.randint(1, 300)),
+                  ("elevation", "double_value", random_numbers.choice([408.5, 0.1, -12.0]))]
+    writer.add(decoder.POINT, [points], properties, feature_id=index * 10 + 3)
+
+
+def _edge(tile):
+    writer = LayerWriter(tile, u"edge")
+    values = [("int_value", -2 ** 63), ("int_value", 2 ** 63 - 1), ("int_value", 0),
+              ("uint_value", 2 ** 64 - 1), ("uint_value", 0),
+              ("sint_value", -2 ** 63), ("sint_value", 2 ** 63 - 1), ("sint_value", -1),
+              ("float_value", 3.5), ("float_value", float("inf")), ("float_value", float("-inf")),
+              ("double_value", 0.1), ("double_value", float("inf")), ("double_value", -1e308),
+              ("string_value", u""), ("string_value", u"ünïcödé"), ("bool_value", True), ("bool_value", False)]
+    properties = [(u"%s_%s" % (field, index), field, value) for index, (field, value) in enumerate(values)]
+    # the largest ids, a feature without an id and a point at the corner of the extent
+    writer.add(decoder.POINT, [[(0, 0)]], properties, feature_id=2 ** 64 - 1)
+    writer.add(decoder.POINT, [[(EXTENT, EXTENT)]], properties[:3], feature_id=2 ** 63)
+    writer.add(decoder.POINT, [[(-1, -1)]], [(u"empty", "string_value", u"")])
+    # a feature without geometry, an unclosed polygon, a single vertex line and huge deltas
+    writer.add(decoder.POINT, [], feature_id=1)
+    writer.add(decoder.POLYGON, [_rectangle(0, 0, 20, 20)], feature_id=2, close=False)
+    writer.add(decoder.LINESTRING, [[(5, 5)]], feature_id=3)
+    writer.add(decoder.LINESTRING, [[(300, 300), (1000000, -1000000), (-1000000, 15)]], feature_id=4)
+    writer.add(decoder.POLYGON, [_rectangle(0, 0, 200, 200), _rectangle(10, 10, 20, 20, clockwise=False),
+                                 _rectangle(300, 300, 50, 50), _rectangle(310, 310, 5, 5, clockwise=False)],
+               feature_id=5)
+
+
+def make_tile():
+    random_numbers = random.Random(14)
+    tile = decoder.vector_tile.tile()
+    writer = LayerWriter(tile, u"building")
+    for index in range(300):
+        _building(random_numbers, writer, index)
+    writer = LayerWriter(tile, u"transportation")
+    for index in range(150):
+        _road(random_numbers, writer, index)
+    writer = LayerWriter(tile, u"poi")
+    for index in range(40):
+        _poi(random_numbers, writer, index)
+    _edge(tile)
+    return tile.SerializeToString()
+
+
+if __name__ == "__main__":
+    with open(FILE_NAME, "wb") as f:
+        f.write(make_tile())
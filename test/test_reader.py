@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+""" THIS COMMENT MUST NOT REMAIN INTACT
+
+GNU GENERAL PUBLIC LICENSE
+
+Copyright (c) 2015 geometalab HSR
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+"""
+
+from contrib.mapbox_vector_tile import compiled, decoder
+
+import numbers
+import os
+import unittest
+
+# written by scripts/make_test_tile.py
+TILE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "test_tile.pbf")
+
+# the transform of the tile 14/8580/10645 (zurich) into mercator meters, see vtr_tile.tile_transform
+TRANSFORM = (0.5971642834774684, 949042.1431887485, 0.5971642834774684, 6000000.972273197)
+
+
+def read_tile():
+    with open(TILE_FILE, "rb") as f:
+        return f.read()
+
+
+def plain(tile):
+    # the decoded tile with the flat columns as lists, the numpy arrays and arrays do not compare with ==
+    for name in tile:
+        columns = tile[name].get("columns")
+        if columns is not None:
+            tile[name]["columns"] = dict((column, list(columns[column])) for column in columns)
+    return tile
+
+
+def typed(value):
+    # the value with the kind of every number, equal values of another kind (e.g. 0 and 0.0) must not compare equal.
+    # int and long of python 2 are the same kind, the backends do not agree on them.
+    if isinstance(value, dict):
+        return dict((key, typed(value[key])) for key in value)
+    if isinstance(value, (list, tuple)):
+        return [typed(item) for item in value]
+    if isinstance(value, bool):
+        return "bool", value
+    if isinstance(value, numbers.Integral):
+        return "integral", value
+    if isinstance(value, numbers.Real):
+        return "real", value
+    return value
+
+
+def plain_views(views):
+    # the lazy views of the layers as the structure of getMessage
+    return dict((name, {
+        "extent": view.extent,
+        "version": view.version,
+        "features": [{"id": feature.id, "type": feature.type, "properties": feature.properties,
+                      "geometry": feature.geometry} for feature in view]
+    }) for name, view in views.items())
+
+
+class DecodingModes:
+    """
+     * DecodingModes runs a test in every way the decoder may decode a tile: per feature and in bulk with numpy,
+       and without numpy at all.
+    """
+
+    def setUp(self):
+        self.tile = read_tile()
+        self._numpy = decoder.numpy
+        self._bulk_min_features = decoder.BULK_MIN_FEATURES
+
+    def tearDown(self):
+        decoder.numpy = self._numpy
+        decoder.BULK_MIN_FEATURES = self._bulk_min_features
+
+    def modes(self):
+        # sets up the decoder for every mode, yields the name of the mode
+        for name, numpy, bulk_min_features in [("per feature", self._numpy, 10 ** 9), ("bulk", self._numpy, 1),
+                                               ("without numpy", None, 1)]:
+            if name != "without numpy" and numpy is None:
+                continue
+            decoder.numpy = numpy
+            decoder.BULK_MIN_FEATURES = bulk_min_features
+            yield name
+
+
+class WireConformanceTest(DecodingModes, unittest.TestCase):
+    """
+     * The wire format reader (reader.py) must decode the test tile exactly like the generated classes of
+       the vendored protobuf runtime, for the nested, the flat and the lazy output.
+    """
+
+    def assertBackendsEqual(self, decode):
+        for mode in self.modes():
+            expected = typed(decode(decoder.TileData("protobuf")))
+            self.assertEqual(typed(decode(decoder.TileData("wire"))), expected, mode)
+
+    def test_nested(self):
+        self.assertBackendsEqual(lambda tile_data: tile_data.getMessage(self.tile))
+
+    def test_flat(self):
+        self.assertBackendsEqual(lambda tile_data: plain(tile_data.getMessage(self.tile, flat=True)))
+
+    def test_transformed(self):
+        self.assertBackendsEqual(lambda tile_data: tile_data.getMessage(self.tile, transform=TRANSFORM))
+        self.assertBackendsEqual(
+            lambda tile_data: plain(tile_data.getMessage(self.tile, flat=True, transform=TRANSFORM)))
+
+    def test_lazy(self):
+        self.assertBackendsEqual(lambda tile_data: plain_views(tile_data.getLayers(self.tile)))
+
+    def test_allow_lists(self):
+        layers = set([u"building", u"edge"])
+        keys = set([u"render_height", u"int_value_0", u"uint_value_3", u"string_value_14"])
+        self.assertBackendsEqual(lambda tile_data: tile_data.getMessage(self.tile, layers=layers, keys=keys))
+        self.assertBackendsEqual(
+            lambda tile_data: plain(tile_data.getMessage(self.tile, flat=True, layers=layers, keys=keys)))
+        self.assertBackendsEqual(lambda tile_data: plain_views(tile_data.getLayers(self.tile, layers, keys)))
+
+    def test_buffers(self):
+        # the wire format reader takes any buffer of the tile, e.g. the buffer of a sqlite row
+        expected = decoder.TileData("wire").getMessage(self.tile)
+        for buffer_type in (bytearray, memoryview):
+            self.assertEqual(decoder.TileData("wire").getMessage(buffer_type(self.tile)), expected)
+
+    def test_reused(self):
+        # the TileData of a Mapzen decodes many tiles, nothing of a tile may leak into the next one
+        tile_data = decoder.TileData("wire")
+        expected = tile_data.getMessage(self.tile)
+        tile_data.getMessage(self.tile, flat=True, layers=set([u"poi"]))
+        self.assertEqual(tile_data.getMessage(self.tile), expected)
+
+
+@unittest.skipIf(compiled.implementation() is None, "there is no compiled protobuf runtime")
+class CompiledParityTest(DecodingModes, unittest.TestCase):
+    """
+     * The compiled protobuf runtime of the system must decode the test tile exactly like the vendored one
+       and the wire format reader.
+    """
+
+    def assertBackendsEqual(self, decode):
+        for mode in self.modes():
+            compiled_tile = typed(decode(decoder.TileData("compiled")))
+            self.assertEqual(compiled_tile, typed(decode(decoder.TileData("protobuf"))), mode)
+            self.assertEqual(compiled_tile, typed(decode(decoder.TileData("wire"))), mode)
+
+    def test_backend(self):
+        self.assertEqual(decoder.TileData("compiled").backend, "compiled")
+
+    def test_nested(self):
+        self.assertBackendsEqual(lambda tile_data: tile_data.getMessage(self.tile))
+
+    def test_flat(self):
+        self.assertBackendsEqual(lambda tile_data: plain(tile_data.getMessage(self.tile, flat=True)))
+
+    def test_transformed(self):
+        self.assertBackendsEqual(lambda tile_data: tile_data.getMessage(self.tile, transform=TRANSFORM))
+        self.assertBackendsEqual(
+            lambda tile_data: plain(tile_data.getMessage(self.tile, flat=True, transform=TRANSFORM)))
+
+    def test_lazy(self):
+        self.assertBackendsEqual(lambda tile_data: plain_views(tile_data.getLayers(self.tile)))
+
+    def test_buffers(self):
+        # the compiled runtime parses the buffers without copying them
+        expected = decoder.TileData("compiled").getMessage(self.tile)
+        for buffer_type in (bytearray, memoryview):
+            self.assertEqual(decoder.TileData("compiled").getMessage(buffer_type(self.tile)), expected)
+
+    def test_geometry_integers(self):
+        # the compiled runtime of python 2 returns long, the geometries are made of int like for the others
+        for mode in self.modes():
+            tile = decoder.TileData("compiled").getMessage(self.tile)
+            for name in tile:
+                for feature in tile[name]["features"]:
+                    self.assertTrue(all(type(number) is int for number in _numbers(feature["geometry"])), mode)
+
+
+class EdgeValuesTest(unittest.TestCase):
+    """
+     * The extreme values of the layer edge of the test tile are decoded to exactly these python values.
+    """
+
+    def setUp(self):
+        self.tile = read_tile()
+
+    def check(self, backend):
+        features = decoder.TileData(backend).getMessage(self.tile)[u"edge"]["features"]
+        self.assertEqual([feature["id"] for feature in features[:3]], [2 ** 64 - 1, 2 ** 63, 0])
+        properties = features[0]["properties"]
+        expected = {u"int_value_0": -2 ** 63, u"int_value_1": 2 ** 63 - 1, u"int_value_2": 0,
+                    u"uint_value_3": 2 ** 64 - 1, u"uint_value_4": 0,
+                    u"sint_value_5": -2 ** 63, u"sint_value_6": 2 ** 63 - 1, u"sint_value_7": -1,
+                    u"float_value_8": 3.5, u"float_value_9": float("inf"), u"float_value_10": float("-inf"),
+                    u"double_value_11": 0.1, u"double_value_12": float("inf"), u"double_value_13": -1e308,
+                    u"string_value_14": u"", u"string_value_15": u"ünïcödé",
+                    u"bool_value_16": True, u"bool_value_17": False}
+        self.assertEqual(typed(properties), typed(expected))
+        self.assertEqual(features[2]["properties"], {u"empty": u""})
+        self.assertEqual(features[3]["geometry"], [])
+
+    def test_wire(self):
+        self.check("wire")
+
+    def test_protobuf(self):
+        self.check("protobuf")
+
+    @unittest.skipIf(compiled.implementation() is None, "there is no compiled protobuf runtime")
+    def test_compiled(self):
+        self.check("compiled")
+
+
+def _numbers(geometry):
+    # all the numbers of a nested geometry
+    for item in geometry:
+        if isinstance(item, list):
+            for number in _numbers(item):
+                yield number
+        else:
+            yield item
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+""" THIS COMMENT MUST NOT REMAIN INTACT
+
+GNU GENERAL PUBLIC LICENSE
+
+Copyright (c) 2015 geometalab HSR
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+"""
+
+from test_reader import DecodingModes
+from vtr_tile import decode_rows, inflate, GEOGRAPHIC, MERCATOR
+
+import gzip
+import io
+import unittest
+import zlib
+
+# the tile of the transform of test_reader, as a row of the tiles table
+ZOOM, COLUMN, ROW = 14, 8580, 10645
+
+
+class FeatureBuilderTest(DecodingModes, unittest.TestCase):
+    """
+     * The features which decode_rows builds from the test tile (see scripts/make_test_tile.py) must keep
+       all their parts: a MultiPoint all its points, a MultiLineString all its lines and a MultiPolygon
+       its polygons with their own holes.
+    """
+
+    def features(self, layer, crs=MERCATOR):
+        # the (geo_type, feature) tuples of a layer of the test tile, in the order of the layer
+        row = (ZOOM, COLUMN, ROW, self.tile)
+        tile, features = next(decode_rows([row], ([layer], None), crs=crs))
+        self.assertEqual(tile, [ZOOM, COLUMN, ROW])
+        return features
+
+    def assertRing(self, ring, vertices=5):
+        self.assertEqual(len(ring), vertices)
+        self.assertEqual(ring[0], ring[-1])
+
+    def test_polygons(self):
+        # every 7th building has a courtyard, every 11th a second polygon
+        for mode in self.modes():
+            features = self.features(u"building")
+            self.assertEqual(len(features), 300, mode)
+            for index, (geo_type, feature) in enumerate(features):
+                self.assertEqual(geo_type, "Polygon", mode)
+                geometry = feature["geometry"]
+                polygons = [geometry["coordinates"]]
+                if index % 11 == 0:
+                    self.assertEqual(geometry["type"], "MultiPolygon", mode)
+                    polygons = geometry["coordinates"]
+                    self.assertEqual(len(polygons), 2, mode)
+                    self.assertEqual(len(polygons[1]), 1, mode)
+                else:
+                    self.assertEqual(geometry["type"], "Polygon", mode)
+                self.assertEqual(len(polygons[0]), 2 if index % 7 == 0 else 1, mode)
+                for polygon in polygons:
+                    for ring in polygon:
+                        self.assertRing(ring)
+
+    def test_lines(self):
+        # every 9th road has two lines
+        for mode in self.modes():
+            features = self.features(u"transportation")
+            self.assertEqual(len(features), 150, mode)
+            for index, (geo_type, feature) in enumerate(features):
+                self.assertEqual(geo_type, "LineString", mode)
+                geometry = feature["geometry"]
+                if index % 9 == 0:
+                    self.assertEqual(geometry["type"], "MultiLineString", mode)
+                    self.assertEqual(len(geometry["coordinates"]), 2, mode)
+                    lines = geometry["coordinates"]
+                else:
+                    self.assertEqual(geometry["type"], "LineString", mode)
+                    lines = [geometry["coordinates"]]
+                for line in lines:
+                    self.assertTrue(len(line) >= 2, mode)
+                    self.assertTrue(all(len(vertex) == 2 for vertex in line), mode)
+
+    def test_points(self):
+        # every 8th poi has three points
+        for mode in self.modes():
+            features = self.features(u"poi")
+            self.assertEqual(len(features), 40, mode)
+            for index, (geo_type, feature) in enumerate(features):
+                self.assertEqual(geo_type, "Point", mode)
+                geometry = feature["geometry"]
+                if index % 8 == 0:
+                    self.assertEqual(geometry["type"], "MultiPoint", mode)
+                    self.assertEqual(len(geometry["coordinates"]), 3, mode)
+                    self.assertTrue(all(len(vertex) == 2 for vertex in geometry["coordinates"]), mode)
+                else:
+                    self.assertEqual(geometry["type"], "Point", mode)
+                    self.assertEqual(len(geometry["coordinates"]), 2, mode)
+
+    def test_edge(self):
+        # the feature without geometry is skipped, the unclosed polygon is closed
+        for mode in self.modes():
+            features = self.features(u"edge")
+            self.assertEqual([feature["geometry"]["type"] for geo_type, feature in features],
+                             ["Point", "Point", "Point", "Polygon", "LineString", "LineString", "MultiPolygon"],
+                             mode)
+            self.assertEqual(features[0][1]["geometry"]["coordinates"], [949042, 6002446], mode)
+            self.assertEqual(features[0][1]["properties"][u"bool_value_16"], True, mode)
+            self.assertRing(features[3][1]["geometry"]["coordinates"][0])
+            self.assertEqual(features[4][1]["geometry"]["coordinates"], [[949045, 6002443]], mode)
+            self.assertEqual(features[5][1]["geometry"]["coordinates"],
+                             [[949221, 6002267], [1546206, 6599611], [351877, 6002437]], mode)
+            self.assertEqual(features[6][1]["geometry"]["coordinates"], [
+                [[[949042, 6002446], [949161, 6002446], [949161, 6002327], [949042, 6002327], [949042, 6002446]],
+                 [[949048, 6002429], [949060, 6002429], [949060, 6002440], [949048, 6002440], [949048, 6002429]]],
+                [[[949221, 6002267], [949251, 6002267], [949251, 6002237], [949221, 6002237], [949221, 6002267]],
+                 [[949227, 6002258], [949230, 6002258], [949230, 6002261], [949227, 6002261], [949227, 6002258]]]],
+                mode)
+
+    def test_geographic(self):
+        # the longitudes and latitudes have the same structure, the tile is in zurich
+        for mode in self.modes():
+            for layer in (u"building", u"transportation", u"poi", u"edge"):
+                mercator = self.features(layer)
+                geographic = self.features(layer, GEOGRAPHIC)
+                self.assertEqual([_structure(feature["geometry"]) for geo_type, feature in geographic],
+                                 [_structure(feature["geometry"]) for geo_type, feature in mercator], mode)
+            lon, lat = geographic[0][1]["geometry"]["coordinates"]
+            self.assertAlmostEqual(lon, 8.5254, 4)
+            self.assertAlmostEqual(lat, 47.3686, 4)
+
+
+class InflateTest(unittest.TestCase):
+    """
+     * inflate takes the tile blob as bytes or as any buffer, whether it is gzip or zlib compressed or not at all.
+    """
+
+    def setUp(self):
+        self.tile = b"\x1a\x05tile"
+        output = io.BytesIO()
+        with gzip.GzipFile(fileobj=output, mode="wb") as f:
+            f.write(self.tile)
+        self.blobs = {"gzip": output.getvalue(), "zlib": zlib.compress(self.tile), "none": self.tile}
+
+    def test_buffers(self):
+        for compression, blob in self.blobs.items():
+            for buffer_type in (bytes, bytearray, memoryview):
+                self.assertEqual(bytearray(inflate(buffer_type(blob))), bytearray(self.tile),
+                                 (compression, buffer_type))
+
+
+def _structure(geometry):
+    # the type and the nesting of the coordinates of a geometry, without the coordinates
+    def lengths(coordinates):
+        if isinstance(coordinates[0], list):
+            return [lengths(item) for item in coordinates]
+        return len(coordinates)
+    return geometry["type"], lengths(geometry["coordinates"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+""" THIS COMMENT MUST NOT REMAIN INTACT
+
+GNU GENERAL PUBLIC LICENSE
+
+Copyright (c) 2015 geometalab HSR
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+"""
+
+from collections import OrderedDict
+
+import hashlib
+import marshal
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+
+DEFAULT_BUDGET = 256 * 1024 * 1024
+DEFAULT_DISK_BUDGET = 1024 * 1024 * 1024
+
+# raised whenever the decoded features change, the tiles of the disk caches are decoded again
+FEATURE_VERSION = 2
+# raised whenever the tables of the disk caches change
+_LAYOUT_VERSION = 2
+
+# rough sizes of the python objects of a decoded feature in bytes
+_FEATURE_SIZE = 800
+_PROPERTY_SIZE = 120
+_COORDINATE_SIZE = 120
+
+
+class TileCache(object):
+    """
+     * The TileCache keeps the decoded and transformed tiles in memory, the least recently used are evicted first.
+     >> The key of a tile is (path of the mbtile file, its modification time, projection, zoom, column, row),
+        a changed file therefore never hits old tiles. The projection tells which layers and keys were decoded.
+     >> The size of every tile is approximated when it is put into the cache (approximate_size).
+        Tiles are evicted as long as the sum of the sizes is above the budget.
+     * The cache is used by the loading thread and qgis itself, all access is locked.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self._tiles = OrderedDict()  # key: (value, size)
+        self._budget = budget
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def budget(self):
+        return self._budget
+
+    @budget.setter
+    def budget(self, budget):
+        with self._lock:
+            self._budget = budget
+            self._evict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._tiles.pop(key, None)
+            if entry is None:
+                return None
+            self._tiles[key] = entry
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        if size is None:
+            size = approximate_size(value)
+        with self._lock:
+            entry = self._tiles.pop(key, None)
+            if entry is not None:
+                self._size -= entry[1]
+            if size > self._budget:
+                return
+            self._tiles[key] = (value, size)
+            self._size += size
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self._size = 0
+
+    def _evict(self):
+        while self._size > self._budget:
+            key, entry = self._tiles.popitem(last=False)
+            self._size -= entry[1]
+
+
+def approximate_size(tile):
+    # approximate the memory used by a decoded tile, tile:: (geometry, list of (geo_type, feature))
+    size = 0
+    for geo_type, feature in tile[1]:
+        size += _FEATURE_SIZE + _PROPERTY_SIZE * len(feature["properties"])
+        size += _COORDINATE_SIZE * _count_coordinates(feature["geometry"]["coordinates"])
+    return size
+
+
+def _count_coordinates(coordinates):
+    if not coordinates or not isinstance(coordinates[0], list):
+        return 1
+    return sum(_count_coordinates(part) for part in coordinates)
+
+
+class DiskTileCache(object):
+    """
+     * The DiskTileCache keeps the decoded tiles of one mbtile file in a sqlite file in the cache directory,
+       so they survive a restart of qgis.
+     >> The cache file remembers the identity of its mbtile file (path, size and modification time).
+        If it does not match any more, all the tiles of the cache file are dropped.
+     >> The tiles of all projections share the file, the key of a tile starts with the key of its projection.
+     >> The features of a tile are stored as a compact list of (geo_type, geometry type, coordinates, properties),
+        serialized with marshal and compressed with zlib. marshal is only stable for the same python,
+        so its version is part of the identity as well. So is the version of the features (FEATURE_VERSION).
+     * Tiles are written in a transaction which is committed by commit, not after every tile.
+     * A failing database (e.g. a full disk) never fails the loading, the tiles are just not cached then.
+    """
+    _format = "%s.%s-%s-%s-%s" % (sys.version_info[0], sys.version_info[1], marshal.version, FEATURE_VERSION,
+                                  _LAYOUT_VERSION)
+
+    def __init__(self, file_name, source):
+        # source:: (path, modification time) of the mbtile file
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_name, check_same_thread=False)
+        self._connection.execute("PRAGMA synchronous = OFF;")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS source (path TEXT, size INTEGER, mtime REAL, format TEXT);")
+        identity = (source[0], os.path.getsize(source[0]), source[1], self._format)
+        if self._connection.execute("SELECT path, size, mtime, format FROM source;").fetchone() != identity:
+            self._connection.execute("DELETE FROM source;")
+            self._connection.execute("DROP TABLE IF EXISTS tiles;")
+            self._connection.execute("INSERT INTO source VALUES (?, ?, ?, ?);", identity)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS tiles (projection TEXT, zoom_level INTEGER, "
+                                 "tile_column INTEGER, tile_row INTEGER, features BLOB, "
+                                 "PRIMARY KEY (projection, zoom_level, tile_column, tile_row));")
+        self._connection.commit()
+
+    def get(self, projection, tile):
+        # projection:: the key of the projection (see vtr_tile.projection_key), tile:: (zoom, column, row)
+        try:
+            with self._lock:
+                row = self._connection.execute("SELECT features FROM tiles WHERE projection = ? AND zoom_level = ? "
+                                               "AND tile_column = ? AND tile_row = ?;",
+                                               (projection,) + tuple(tile)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        features = []
+        for geo_type, geometry_type, coordinates, properties in marshal.loads(zlib.decompress(row[0])):
+            features.append((geo_type, {
+                "type": "Feature",
+                "geometry": {
+                    "type": geometry_type,
+                    "coordinates": coordinates
+                },
+                "properties": properties
+            }))
+        return list(tile), features
+
+    def put(self, projection, tile, value):
+        compact = [(geo_type, feature["geometry"]["type"], feature["geometry"]["coordinates"], feature["properties"])
+                   for geo_type, feature in value[1]]
+        data = sqlite3.Binary(zlib.compress(marshal.dumps(compact), 1))
+        try:
+            with self._lock:
+                self._connection.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?);",
+                                         (projection,) + tuple(tile) + (data,))
+        except sqlite3.Error:
+            pass
+
+    def commit(self):
+        try:
+            with self._lock:
+                self._connection.commit()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        self.commit()
+        with self._lock:
+            self._connection.close()
+
+
+def disk_cache(source):
+    # return the disk cache of the mbtile file, None if the disk cache is switched off or can not be used.
+    # source:: (path, modification time) of the mbtile file
+    if disk_cache_directory is None:
+        return None
+    cache = _disk_caches.get(source[0])
+    if cache is None or cache[0] != source[1]:
+        if cache is not None:
+            del _disk_caches[source[0]]
+            cache[1].close()
+        path = source[0] if isinstance(source[0], bytes) else source[0].encode("utf-8")
+        file_name = os.path.join(disk_cache_directory, "%s.sqlite" % hashlib.sha1(path).hexdigest())
+        try:
+            if not os.path.isdir(disk_cache_directory):
+                os.makedirs(disk_cache_directory)
+            _prune_disk_caches(file_name)
+            cache = source[1], DiskTileCache(file_name, source)
+        except (EnvironmentError, sqlite3.Error):
+            # e.g. a directory which can not be written, the tiles are only cached in memory then.
+            return None
+        _disk_caches[source[0]] = cache
+    return cache[1]
+
+
+def _prune_disk_caches(keep):
+    # delete the least recently written cache files until the cache directory fits into disk_cache_budget.
+    # keep:: the cache file which is opened next, it is kept just like the cache files which are open.
+    kept = set(cache[1].file_name for cache in _disk_caches.values())
+    kept.add(keep)
+    files = []
+    for name in os.listdir(disk_cache_directory):
+        if name.endswith(".sqlite"):
+            path = os.path.join(disk_cache_directory, name)
+            files.append((os.path.getmtime(path), os.path.getsize(path), path))
+    size = sum(file_size for mtime, file_size, path in files)
+    for mtime, file_size, path in sorted(files):
+        if size <= disk_cache_budget:
+            break
+        if path not in kept:
+            try:
+                os.remove(path)
+                size -= file_size
+            except OSError:
+                pass
+
+
+def close_disk_caches():
+    for mtime, cache in _disk_caches.values():
+        cache.close()
+    _disk_caches.clear()
+
+
+tile_cache = TileCache()
+
+# the directory of the disk caches, None switches the disk cache off. The plugin puts it into the settings of qgis.
+disk_cache_directory = None
+# the size of all the files in the directory, the least recently written are deleted when a cache is opened.
+disk_cache_budget = DEFAULT_DISK_BUDGET
+_disk_caches = {}  # path of the mbtile file: (mtime, DiskTileCache)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+""" THIS COMMENT MUST NOT REMAIN INTACT
+
+GNU GENERAL PUBLIC LICENSE
+
+Copyright (c) 2015 geometalab HSR
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+"""
+
+import os
+import sqlite3
+
+try:
+    from urllib import pathname2url
+except ImportError:
+    from urllib.request import pathname2url
+
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 64 * 1024
+
+
+class ConnectionManager:
+    """
+     * Keeps one read-only connection per mbtile file, shared by all Model instances.
+     >> A connection is opened through a read-only URI (if the sqlite module supports it) and tuned
+        with the mmap_size, cache_size and query_only pragmas.
+     >> The connection is reused as long as the modification time of the file did not change,
+        so the page cache stays warm across repeated loads.
+     * close_all has to be called when the plugin is unloaded.
+     * A connection can only be used by the thread which opened it, the shared ones belong to the main thread.
+       Other threads open a connection of their own (open) and close it themselves.
+    """
+    _connections = {}  # path: (connection, mtime)
+
+    @classmethod
+    def connection(cls, database_source):
+        # return the shared connection of the mbtile file, open a new one if needed.
+        path = os.path.realpath(database_source)
+        mtime = os.path.getmtime(path)
+        entry = cls._connections.get(path)
+        if entry and entry[1] == mtime:
+            return entry[0]
+        if entry:
+            entry[0].close()
+        con = cls._open(path)
+        cls._connections[path] = (con, mtime)
+        return con
+
+    @classmethod
+    def close(cls, database_source):
+        entry = cls._connections.pop(os.path.realpath(database_source), None)
+        if entry:
+            entry[0].close()
+
+    @classmethod
+    def close_all(cls):
+        for con, mtime in cls._connections.values():
+            con.close()
+        cls._connections.clear()
+
+    @classmethod
+    def open(cls, database_source):
+        # open a read-only connection which is not shared, the caller has to close it.
+        return cls._open(os.path.realpath(database_source))
+
+    @staticmethod
+    def _open(path):
+        try:
+            con = sqlite3.connect("file:%s?mode=ro" % pathname2url(path), uri=True)
+        except TypeError:
+            # the sqlite3 module of python 2 does not know about uri filenames.
+            con = sqlite3.connect(path)
+        con.execute("PRAGMA query_only = 1;")
+        con.execute("PRAGMA mmap_size = %d;" % MMAP_SIZE)
+        con.execute("PRAGMA cache_size = %d;" % -CACHE_SIZE_KIB)
+        return con
@@ -15,6 +15,7 @@ of the License, or (at your option) any later version.
 
 from ui_vtr import VtrDialog
 from vtr_model import Model
+from vtr_tile import MERCATOR, GEOGRAPHIC
 
 from qgis.core import QgsProject
 from PyQt4.QtGui import QFileDialog, QDesktopServices
@@ -23,6 +24,8 @@ from PyQt4.QtCore import QFileInfo
 
 import os
 
+LOAD_MODES = ["memory", "geojson"]
+
 
 class Dialog:
 
@@ -33,6 +36,13 @@ class Dialog:
         self._init_connections()
         self._settings = project_settings
         self._browse_open_path = _default_directory(project_settings)
+        self.new_dialog.workersSpinBox.setValue(int(project_settings.value('decodeWorkers', 0)))
+        load_mode = project_settings.value('loadMode', LOAD_MODES[0])
+        self.new_dialog.loadModeComboBox.setCurrentIndex(LOAD_MODES.index(load_mode) if load_mode in LOAD_MODES else 0)
+        self.new_dialog.followCanvasCheckBox.setChecked(project_settings.value('followCanvas', False, type=bool))
+        self.new_dialog.geographicCheckBox.setChecked(project_settings.value('geographicOutput', False, type=bool))
+        self.new_dialog.layerFilter.setText(project_settings.value('layerFilter', ''))
+        self.new_dialog.attributeFilter.setText(project_settings.value('attributeFilter', ''))
 
     def create_dialog(self):
         if self.new_dialog.isVisible():
@@ -46,8 +56,27 @@ class Dialog:
                 #  take a default mbtile if non is selected.
                 dir_path = os.path.dirname(os.path.abspath(__file__))
                 file_path = "%s/data/zurich.mbtiles" % dir_path
-            model = Model(self._iface, file_path)
-            model.mbtiles()
+            workers = self.new_dialog.workersSpinBox.value()
+            self._settings.setValue('decodeWorkers', workers)
+            load_mode = LOAD_MODES[self.new_dialog.loadModeComboBox.currentIndex()]
+            self._settings.setValue('loadMode', load_mode)
+            follow_canvas = self.new_dialog.followCanvasCheckBox.isChecked()
+            self._settings.setValue('followCanvas', follow_canvas)
+            geographic = self.new_dialog.geographicCheckBox.isChecked()
+            self._settings.setValue('geographicOutput', geographic)
+            layer_filter = self.new_dialog.layerFilter.text()
+            attribute_filter = self.new_dialog.attributeFilter.text()
+            self._settings.setValue('layerFilter', layer_filter)
+            self._settings.setValue('attributeFilter', attribute_filter)
+            projection = None
+            if layer_filter.strip() or attribute_filter.strip():
+                projection = _allow_list(layer_filter), _allow_list(attribute_filter)
+            model = Model(self._iface, file_path, workers, load_mode, projection,
+                          GEOGRAPHIC if geographic else MERCATOR)
+            if follow_canvas:
+                model.follow_canvas()
+            else:
+                model.load()
 
     def _init_connections(self):
         self.new_dialog.acceptButton.clicked.connect(self.new_dialog.accept)
@@ -78,3 +107,9 @@ def _default_directory(settings):
             if absolute_project_path == "./" \
             else absolute_project_path
     return current_directory
+
+
+def _allow_list(text):
+    # the names of a comma separated list, None if it is empty
+    names = set(name.strip() for name in text.split(",") if name.strip())
+    return names or None
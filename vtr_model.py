@@ -13,97 +13,286 @@ of the License, or (at your option) any later version.
 
 """
 
-from contrib.mapbox_vector_tile import Mapzen
 from contrib.globalmaptiles import *
+from vtr_connection import ConnectionManager
+from vtr_tile import decode_tiles, MERCATOR
+from vtr_task import LoadTask
+from vtr_sink import GeoJsonSink, MemoryLayerSink
 
 from qgis.core import *
+from qgis.gui import QgsMessageBar
+from PyQt4.QtCore import QTimer
+from PyQt4.QtGui import QProgressBar, QPushButton
 
 import json
-import sqlite3
-import gzip
 import os
 import uuid
 
-extent = 4096
-
 
 class Model:
     """
      * The Model is initiated with a proper database(mbtile) file.
      * The function mbtiles is called, it is the main function of the class. It handles following:
      >> Initializing the database and extracting the metadata.
-     >> Iterating through all sql queries and taking necessary actions recarding their output.
-     >> For every iteration a file will be created and unziped. The file_content still binary will be
+     >> Iterating through the rows of the tile range query and passing them on to (decode_tiles).
+     >> Every tile blob is inflated in memory (inflate). The file_content still binary will be
         converted using the mapbox_vector_tile library (decode)
-     >> The extracted data will be given to (_write_feature)
-     * _write_features iterates through all the features in the current json, its purpose is to create
-       a geojson conform json.
-     >> For every feauter the function (build_object) is called.
-     * _build_object has a lot of fixes, which should be removed at some point.
-     >> It takes the coordinates from the data and passes it on to (_mercator_geometry) to get proper mercator data.
-     >> It handles the coordinates due to Multi Type issue.
-     >> It creates a feature object with type, geometry and metadata.
-     * we return to the (mbtiles) function. After the loop, we iterate through the avaiable geojson.
-     >> For each geojson we create a layer in qgis.
+     >> Only the source layers and property keys of the projection are decoded, if there is one.
+     >> The extracted data will be given to the FeatureBuilder, which creates geojson conform features
+        in mercator coordinates, or in longitudes and latitudes (crs). With workers the tiles are decoded
+        in a pool of processes, which hand back the compact flat columns. The features are built from them
+        in the order of the tiles.
+        Decoded tiles are kept in the tile cache and in a disk cache per mbtile file,
+        a tile which is loaded again is not decoded a second time, not even after a restart of qgis.
+     >> The features of every tile are handed to a sink in bulk, depending on the load mode:
+        "memory" adds them to memory layers, which get the fields from the metadata up front (MemoryLayerSink),
+        "geojson" streams them into a geojson file per type (GeoJsonSink).
+     * we return to the (mbtiles) function. After the loop, we add the layers of the sink to qgis.
+     >> The geojson files are loaded as ogr layers.
+     * The function load does the same in the background (LoadTask), qgis is not blocked meanwhile.
+     >> Even the rows are read by the task, over a connection of its own.
+     >> The features arrive in batches and are handed to the sink. The memory layers are added to qgis
+        right away, so the features are shown while the rest is loading.
+     >> The progress is shown in the message bar, where the load can be cancelled as well.
+     * The function follow_canvas keeps memory layers in sync with the canvas.
+     >> After the extent or the scale changed, the tile range is calculated again (_update_tiles).
+        The extent is transformed into mercator meters first, if the map is in another coordinate system.
+     >> Only the tiles which are not loaded yet are read and decoded (in the background as well), they are
+        queried in strips (tile_ranges). Every tile remembers the ids of its features.
+     >> The features of tiles of another zoom level or far outside of the tile range are deleted (_drop_tiles).
     """
     directory = os.path.dirname(os.path.abspath(__file__))
-    _tmp = "%s/data/tmp/tmp.txt" % directory
-    _tmp2 = "%s/data/tmp/tmp2.txt" % directory
     _geo = []  # 0: zoom, 1: easting, 2: northing
     _geo_type_options = {1: "Point", 2: "LineString", 3: "Polygon"}
-    _json_data = {"Point": {}, "LineString": {}, "Polygon": {}}
+    _running = set()  # keeps the models alive while their task is running or while they follow the canvas
+    _live_delay = 300  # milliseconds after the last change of the canvas until the tiles are updated
+    _live_margin = 2  # tiles further outside of the tile range are dropped
 
-    def __init__(self, iface, database_source):
+    def __init__(self, iface, database_source, workers=0, load_mode="memory", projection=None, crs=MERCATOR):
+        # projection:: (layers, keys) allow-lists of the source layers and property keys, None loads everything
+        # crs:: the coordinate system of the layers, MERCATOR or GEOGRAPHIC (vtr_tile)
         self._iface = iface
         self.database_source = database_source
         self._canvas = iface.mapCanvas()
         self._layer = None
         self._mbtile_id = "name"
-        self._counter = 0
-        self._bool = True
+        self._fields = {}
+        self._workers = workers
+        self._load_mode = load_mode
+        self._projection = projection
+        self._crs = crs
+        self._sink = None
+        self._task = None
+        self._progress = None
+        self._loaded = {}  # tile: ids of its features per geo_type
+        self._live_timer = None
+        self._live_update = False
+        self._following = False
+        self._error = None  # the message of the failed task
+        self._layer_ids = set()  # the ids of the memory layers which have been added to qgis
 
     def mbtiles(self):
         # connect to a mb_tile file and extract the data
         self._set_metadata()
-        self._create_layer()
+        sink = self._create_sink()
         cursor = self.database_cursor
-        command = self.database_command()
-
-        for sql_query in command:
-            data = cursor.execute(sql_query)
-            for index, row in enumerate(data):
-                if not row:
-                    break  # Maybe the tile did not exist in the database.
-                self._geo = [row[0], row[1], row[2]]
-                # FIXME handle in memory
-                with open(self._tmp, 'wb') as f:
-                    f.write(row[3])
-                with gzip.open(self._tmp, 'rb') as f:
-                    file_content = f.read()
-                # decode the file using Mapzen's decode library
-                decoded_data = Mapzen().decode(file_content)
-                self._write_features(decoded_data, self._geo)
-                os.remove(self._tmp)
+        sql_query, parameters = self.database_command()
 
-        for value in self._geo_type_options:
-            file_src = self.unique_file_name
-            with open(file_src, "w") as f:
-                json.dump(self._json_data[self._geo_type_options[value]], f)
-            self._load_layer(file_src)
+        try:
+            rows = cursor.execute(sql_query, parameters)
+            tiles = decode_tiles(rows, self._workers, self.cache_source, self._projection, self._crs)
+            for self._geo, features in tiles:
+                sink.write_batch(features)
+        finally:
+            sink.close()
+        self._add_layers(sink)
+
+    def load(self):
+        # load the tiles of the current extent in the background and add the features as soon as they are decoded.
+        self._set_metadata()
+        self._sink = self._create_sink()
+        if self._load_mode == "memory":
+            # the memory layers are shown right away and filled while loading.
+            self._add_layers(self._sink)
+        # the rows are read by the task itself
+        self._task = LoadTask(self.database_source, [self.database_command()], self._workers, self.cache_source,
+                              self._projection, self._crs)
+        self._task.batchReady.connect(self._write_batch)
+        self._task.progressChanged.connect(self._show_progress)
+        self._task.failed.connect(self._task_failed)
+        self._task.finished.connect(self._load_finished)
+        if self._load_mode == "memory":
+            QgsMapLayerRegistry.instance().layersWillBeRemoved.connect(self._layers_removed_while_loading)
+        self._create_progress()
+        self._running.add(self)
+        self._task.start()
+
+    def follow_canvas(self):
+        # load the tiles of the current extent and keep loading the tiles which come into view.
+        self._set_metadata()
+        self._load_mode = "memory"
+        self._sink = self._create_sink()
+        self._add_layers(self._sink)
+        self._live_timer = QTimer()
+        self._live_timer.setSingleShot(True)
+        self._live_timer.setInterval(self._live_delay)
+        self._live_timer.timeout.connect(self._update_tiles)
+        self._canvas.extentsChanged.connect(self._canvas_changed)
+        self._canvas.scaleChanged.connect(self._canvas_changed)
+        QgsMapLayerRegistry.instance().layersWillBeRemoved.connect(self._layers_removed)
+        self._following = True
+        self._running.add(self)
+        self._update_tiles()
+
+    def stop_following(self):
+        self._following = False
+        self._canvas.extentsChanged.disconnect(self._canvas_changed)
+        self._canvas.scaleChanged.disconnect(self._canvas_changed)
+        QgsMapLayerRegistry.instance().layersWillBeRemoved.disconnect(self._layers_removed)
+        self._live_timer.stop()
+        if self._task:
+            # the model is kept alive until its task has finished (_update_finished)
+            self._task.cancel()
+        else:
+            self._running.discard(self)
+
+    @classmethod
+    def stop_all(cls):
+        # stop following the canvas and cancel the tasks of all the models, then wait until the tasks stopped.
+        # e.g. before the plugin is unloaded, which closes the connections, caches and the decoding pool.
+        for model in list(cls._running):
+            if model._following:
+                model.stop_following()
+            if model._task:
+                model._task.cancel()
+                model._task.wait()
+
+    def _canvas_changed(self, *args):
+        # wait for the canvas to settle before the tiles are updated
+        self._live_timer.start()
+
+    def _layers_removed(self, layer_ids):
+        # stop following the canvas as soon as one of the layers is removed
+        if set(layer.id() for layer in self._sink.layers.values()) & set(layer_ids):
+            self.stop_following()
+
+    def _update_tiles(self):
+        # load the tiles which came into view and drop the ones which are far away now.
+        if self._task:
+            self._live_update = True
+            return
+        zoom = self.current_zoom
+        tiles = self.calculate_tile_range(self.current_coordinates, zoom)
+        self._drop_tiles(zoom, tiles)
+        new_tiles = set((zoom, column, row) for column in range(tiles[0], tiles[2] + 1)
+                        for row in range(tiles[1], tiles[3] + 1)) - set(self._loaded)
+        if not new_tiles:
+            return
+        # only the strips of new tiles are queried, not the tiles which are loaded already.
+        # the rows are read by the task itself
+        queries = [self.database_command(zoom, tile_range) for tile_range in self.tile_ranges(new_tiles)]
+        for tile in new_tiles:
+            self._loaded[tile] = {}
+
+        self._task = LoadTask(self.database_source, queries, self._workers, self.cache_source, self._projection,
+                              self._crs)
+        self._task.tileReady.connect(self._add_tile)
+        self._task.failed.connect(self._task_failed)
+        self._task.finished.connect(self._update_finished)
+        self._task.start()
+
+    def _add_tile(self, geometry, features):
+        tile = tuple(geometry)
+        if self._following and tile in self._loaded:
+            self._loaded[tile] = self._sink.write_batch(features)
+
+    def _update_finished(self):
+        self._task = None
+        self._show_error()
+        if not self._following:
+            self._running.discard(self)
+            return
+        if self._live_update:
+            self._live_update = False
+            self._update_tiles()
+
+    def _drop_tiles(self, zoom, tiles):
+        # delete the features of the tiles of another zoom level or too far outside of the tile range
+        margin = self._live_margin
+        ids = {}
+        for tile in list(self._loaded):
+            if tile[0] != zoom or not (tiles[0] - margin <= tile[1] <= tiles[2] + margin and
+                                       tiles[1] - margin <= tile[2] <= tiles[3] + margin):
+                for geo_type, feature_ids in self._loaded.pop(tile).items():
+                    ids.setdefault(geo_type, []).extend(feature_ids)
+        self._sink.delete(ids)
+
+    def _create_sink(self):
+        geo_types = self._geo_type_options.values()
+        if self._load_mode == "memory":
+            return MemoryLayerSink(geo_types, self._mbtile_id, self._fields, self._crs)
+        return GeoJsonSink(dict((geo_type, self.unique_file_name) for geo_type in geo_types), self._crs)
 
-    def _create_layer(self):
-        # create a layer for each type
+    def _add_layers(self, sink):
+        # add the layers of the sink to qgis, the geojson files are loaded using ogr.
         for value in self._geo_type_options:
-            self._json_data[self._geo_type_options[value]] = {"type": "FeatureCollection", "crs":
-                {"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::3857"}}, "features": []}
+            geo_type = self._geo_type_options[value]
+            if self._load_mode == "memory":
+                QgsMapLayerRegistry.instance().addMapLayer(sink.layers[geo_type])
+                self._layer_ids.add(sink.layers[geo_type].id())
+            else:
+                self._load_layer(sink.file_names[geo_type])
+
+    def _create_progress(self):
+        # show a progress bar with a cancel button in the message bar, it is busy until the tiles are counted
+        message_bar = self._iface.messageBar()
+        message = message_bar.createMessage("Loading vector tiles of %s" % self._mbtile_id)
+        progress_bar = QProgressBar()
+        progress_bar.setMaximum(0)
+        cancel_button = QPushButton("cancel")
+        cancel_button.clicked.connect(self._task.cancel)
+        message.layout().addWidget(progress_bar)
+        message.layout().addWidget(cancel_button)
+        message_bar.pushWidget(message, QgsMessageBar.INFO)
+        self._progress = message, progress_bar
+
+    def _show_progress(self, done, total):
+        self._progress[1].setMaximum(max(total, 1))
+        self._progress[1].setValue(done)
+
+    def _write_batch(self, batch):
+        # the batches which were still queued when the task was cancelled are dropped, their layers may be gone
+        if not self._task.cancelled:
+            self._sink.write_batch(batch)
+
+    def _layers_removed_while_loading(self, layer_ids):
+        # cancel the load as soon as one of the layers is removed, its features can not be added anymore
+        if self._layer_ids & set(layer_ids):
+            self._task.cancel()
 
-    def _write_features(self, decoded_data, geometry):
-        # iterate through all the features of the data and build proper gejson conform objects.
-        for name in decoded_data:
-            for index, value in enumerate(decoded_data[name]['features']):
-                data, geo_type = self._build_object(decoded_data[name]["features"][index], geometry)
-                if data:
-                    self._json_data[geo_type]["features"].append(data)
+    def _task_failed(self, message):
+        self._error = message
+
+    def _show_error(self):
+        if self._error:
+            self._iface.messageBar().pushMessage("Loading vector tiles of %s failed: %s" % (self._mbtile_id,
+                                                                                            self._error),
+                                                 level=QgsMessageBar.CRITICAL)
+            self._error = None
+
+    def _load_finished(self):
+        self._iface.messageBar().popWidget(self._progress[0])
+        self._sink.close()
+        if self._load_mode == "memory":
+            QgsMapLayerRegistry.instance().layersWillBeRemoved.disconnect(self._layers_removed_while_loading)
+        elif not self._task.cancelled and not self._error:
+            self._add_layers(self._sink)
+        if self._task.cancelled:
+            self._iface.messageBar().pushMessage("Loading vector tiles of %s cancelled" % self._mbtile_id,
+                                                 level=QgsMessageBar.WARNING, duration=3)
+        self._show_error()
+        self._task = None
+        self._running.discard(self)
 
     def _load_layer(self, json_src):
         # load the created geojson into qgis
@@ -111,31 +300,33 @@ class Model:
         layer = QgsVectorLayer(json_src, name, "ogr")
         QgsMapLayerRegistry.instance().addMapLayer(layer)
 
-    def database_command(self):
+    def database_command(self, zoom=None, tiles=None):
         # create a suitable sql query, using the canvas scale and the coordinates of the current extent.
-        zoom = self.current_zoom
-        coordinates = self.current_coordinates
-        tiles = self.calculate_tile_range(coordinates, zoom)
-        commands = []
-        delta_x = tiles[2] - tiles[0]
-        delta_y = tiles[3] - tiles[1]
-        x_index, y_index = 0, 0
-        while x_index <= delta_x:
-            while y_index <= delta_y:
-                commands.append(
-                   "SELECT * FROM tiles WHERE zoom_level=%s and tile_column=%s and tile_row=%s;"
-                   % (zoom, tiles[0] + y_index, tiles[1] + x_index)
-                )
-                y_index += 1
-            x_index += 1
-            y_index = 0
-        return commands
+        # the whole tile range is fetched with a single range scan over the tiles index.
+        # tiles:: a tile range [x_min, y_min, x_max, y_max] of the zoom level instead of the current extent
+        if zoom is None:
+            zoom = self.current_zoom
+        if tiles is None:
+            tiles = self.calculate_tile_range(self.current_coordinates, zoom)
+        command = "SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles " \
+                  "WHERE zoom_level = ? AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ? " \
+                  "ORDER BY tile_column, tile_row;"
+        return command, (zoom, tiles[0], tiles[2], tiles[1], tiles[3])
 
     def _set_metadata(self):
         # get the metadata from the database.
         cursor = self.database_cursor
         cursor.execute("SELECT * FROM metadata WHERE name='id'")
         self._mbtile_id = cursor.fetchone()[1]
+        # the fields of all vector layers, if the mbtile file describes them.
+        cursor.execute("SELECT value FROM metadata WHERE name='json'")
+        row = cursor.fetchone()
+        if row:
+            layers, keys = self._projection or (None, None)
+            for vector_layer in json.loads(row[0]).get("vector_layers", []):
+                if layers is None or vector_layer.get("id") in layers:
+                    fields = vector_layer.get("fields", {})
+                    self._fields.update((key, fields[key]) for key in fields if keys is None or key in keys)
         # other usefull commands
         # "SELECT * FROM metadata WHERE name='center'"
         # "SELECT * FROM metadata WHERE name='maxzoom'"
@@ -143,9 +334,14 @@ class Model:
 
     @property
     def database_cursor(self):
-        # connect to the database and return its corresponding cursor
-        con = sqlite3.connect(self.database_source)
-        return con.cursor()
+        # return a cursor of the shared read-only connection to the database
+        return ConnectionManager.connection(self.database_source).cursor()
+
+    @property
+    def cache_source(self):
+        # the identity of the database for the tile cache
+        path = os.path.realpath(self.database_source)
+        return path, os.path.getmtime(path)
 
     @property
     def unique_file_name(self):
@@ -167,12 +363,48 @@ class Model:
     def current_coordinates(self):
         # get the current mercator coordinates in qgis
         rectangle = self._canvas.extent()
+        crs = self._canvas.mapSettings().destinationCrs()
+        if crs.authid() != MERCATOR:
+            try:
+                transform = QgsCoordinateTransform(crs, QgsCoordinateReferenceSystem(MERCATOR))
+                rectangle = transform.transformBoundingBox(rectangle)
+            except QgsCsException:
+                # the extent reaches beyond the mercator projection, e.g. to the poles
+                origin_shift = GlobalMercator().originShift
+                rectangle = QgsRectangle(-origin_shift, -origin_shift, origin_shift, origin_shift)
         x_min = int(rectangle.xMinimum())
         y_min = int(rectangle.yMinimum())
         x_max = int(rectangle.xMaximum())
         y_max = int(rectangle.yMaximum())
         return [x_min, y_min, x_max, y_max]
 
+    @staticmethod
+    def tile_ranges(tiles):
+        # cover the tiles (zoom, column, row) of a zoom level with tile ranges [x_min, y_min, x_max, y_max]:
+        # the runs of consecutive rows of every column, merged with the same runs of the next columns.
+        # after a pan, the new column and the new row band are a range each.
+        runs = {}  # column: list of (first row, last row)
+        for zoom, column, row in sorted(tiles):
+            column_runs = runs.setdefault(column, [])
+            if column_runs and column_runs[-1][1] == row - 1:
+                column_runs[-1] = (column_runs[-1][0], row)
+            else:
+                column_runs.append((row, row))
+        ranges = []
+        previous = {}  # (first row, last row): the range of the run in the previous column
+        for column in sorted(runs):
+            current = {}
+            for run in runs[column]:
+                tile_range = previous.get(run)
+                if tile_range is not None and tile_range[2] == column - 1:
+                    tile_range[2] = column
+                else:
+                    tile_range = [column, run[0], column, run[1]]
+                    ranges.append(tile_range)
+                current[run] = tile_range
+            previous = current
+        return ranges
+
     @staticmethod
     def calculate_tile_range(coordinates, zoom):
         # return tiles of the displayed map canvas
@@ -180,55 +412,3 @@ class Model:
         tx_min, ty_min = GlobalMercator().MetersToTile(coordinates[0], coordinates[1], zoom)
         tx_max, ty_max = GlobalMercator().MetersToTile(coordinates[2], coordinates[3], zoom)
         return [tx_min - 1, ty_min - 1, tx_max + 1, ty_max + 1]
-
-    def _build_object(self, data, geometry):
-        #  single feature structure
-        geo_type = self._geo_type_options[data["type"]]
-        coordinates = self._mercator_geometry(data["geometry"], geometry, 0)
-        if data["type"] == 2 and self._counter > 0:
-            # if there it is a MultiLineString, the counter will be greater than zero. return None
-            self._counter = 0
-            self._bool = True
-            return None, geo_type
-        if data["type"] == 1:
-            # Due to mercator_geometrys nature, the point will be displayed in a List "[[]]", remove the outer bracket.
-            coordinates = coordinates[0]
-        if data["type"] == 3 and self._counter == 0:
-            # If there is not a polygon in a polygon, one bracket will be missing.
-            coordinates = [coordinates]
-        feature = {
-            "type": "Feature",
-            "geometry": {
-                "type": geo_type,
-                "coordinates": coordinates
-            },
-            "properties": data["properties"]
-        }
-        self._counter = 0
-        self._bool = True
-        return feature, geo_type
-
-    def _mercator_geometry(self, coordinates, geometry, counter):
-        # recursively iterate through all the points and create an array,
-        tmp = []
-
-        for index, value in enumerate(coordinates):
-            if isinstance(coordinates[index][0], int):
-                tmp.append(self._calculate_geometry(coordinates[index], geometry))
-            else:
-                tmp.append(self._mercator_geometry(coordinates[index], geometry, counter + 1))
-        if self._bool:
-            self._counter = counter
-            self._bool = False
-        return tmp
-
-    @staticmethod
-    def _calculate_geometry(coordinates, geometry):
-        # calculate the mercator geometry using external library
-        # geometry:: 0: zoom, 1: easting, 2: northing
-        tmp = GlobalMercator().TileBounds(geometry[1], geometry[2], geometry[0])
-        delta_x = tmp[2] - tmp[0]
-        delta_y = tmp[3] - tmp[1]
-        merc_easting = int(tmp[0] + delta_x / extent * coordinates[0])
-        merc_northing = int(tmp[1] + delta_y / extent * coordinates[1])
-        return [merc_easting, merc_northing]
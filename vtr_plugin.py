@@ -16,9 +16,17 @@ of the License, or (at your option) any later version.
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from qgis import utils
+from qgis.core import QgsApplication, QgsMessageLog
 
 from vtr_dialog import Dialog
 from vtr_dialog import Model
+from vtr_connection import ConnectionManager
+from vtr_tile import close_pool
+from vtr_cache import tile_cache, close_disk_caches, DEFAULT_BUDGET, DEFAULT_DISK_BUDGET
+from contrib.mapbox_vector_tile.decoder import backend_description
+
+import os
+import vtr_cache
 
 
 class Plugin:
@@ -29,6 +37,10 @@ class Plugin:
     def __init__(self, iface):
         self._iface = iface
         self.settings = QSettings("Vector Tile Reader","vectortilereader")
+        tile_cache.budget = int(self.settings.value('tileCacheBudget', DEFAULT_BUDGET))
+        # the disk caches are kept in the settings of qgis, the directory of the plugin is replaced by every update.
+        vtr_cache.disk_cache_directory = os.path.join(QgsApplication.qgisSettingsDirPath(), "vectortilereader", "cache")
+        vtr_cache.disk_cache_budget = int(self.settings.value('diskCacheBudget', DEFAULT_DISK_BUDGET))
 
     def initGui(self):
         vtr_layer_icon = QIcon(':/plugins/vectortilereader/icon.png')
@@ -39,9 +51,18 @@ class Plugin:
         self.vtr_action.triggered.connect(
             lambda: Dialog(self._iface, self.settings).create_dialog()
         )
+        # tell which protobuf backend decodes the tiles, a missing compiled runtime explains slow loading.
+        QgsMessageLog.logMessage("Vector tiles are decoded by the %s" % backend_description(),
+                                 "Vector Tile Reader", QgsMessageLog.INFO)
 
     def unload(self):
         # Remove the plugin menu item and icon
         self._iface.removeToolBarIcon(self.vtr_action)
         self._iface.removePluginMenu("&Add Vector Tiles Layer", self.vtr_action)
         self._iface.removePluginVectorMenu("&Add Vector Tiles Layer", self.vtr_action)
+        # the models would still use the connections, the caches and the pool of decoding processes
+        Model.stop_all()
+        ConnectionManager.close_all()
+        close_pool()
+        tile_cache.clear()
+        close_disk_caches()
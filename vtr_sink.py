@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+""" THIS COMMENT MUST NOT REMAIN INTACT
+
+GNU GENERAL PUBLIC LICENSE
+
+Copyright (c) 2015 geometalab HSR
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+"""
+
+from qgis.core import QgsVectorLayer, QgsFeature, QgsField, QgsGeometry, QgsPoint
+from PyQt4.QtCore import QVariant
+from vtr_tile import MERCATOR, GEOGRAPHIC
+
+import json
+import numbers
+
+_HEADER = '{"type": "FeatureCollection", ' \
+          '"crs": {"type": "name", "properties": {"name": "%s"}}, ' \
+          '"features": ['
+_FOOTER = ']}\n'
+
+# the names of the coordinate systems in geojson, CRS84 has the axis order longitude, latitude
+_CRS_NAMES = {MERCATOR: "urn:ogc:def:crs:EPSG::3857", GEOGRAPHIC: "urn:ogc:def:crs:OGC:1.3:CRS84"}
+
+
+class GeoJsonSink:
+    """
+     * The GeoJsonSink writes one FeatureCollection file per geometry type.
+     >> The files are opened with the header of the collection right away, it names the coordinate system.
+     >> Every feature is serialized and written as soon as it arrives (write), nothing is kept in memory.
+     >> close writes the end of the collections, the files are complete afterwards.
+    """
+
+    def __init__(self, file_names, crs=MERCATOR):
+        # file_names:: geo_type: path of the geojson file
+        # crs:: the coordinate system of the features, MERCATOR or GEOGRAPHIC
+        self.file_names = file_names
+        self._files = {}
+        self._separators = {}
+        for geo_type in file_names:
+            f = open(file_names[geo_type], "w")
+            f.write(_HEADER % _CRS_NAMES[crs])
+            self._files[geo_type] = f
+            self._separators[geo_type] = ""
+
+    def write_batch(self, batch):
+        # batch:: list of (geo_type, feature) tuples
+        for geo_type, feature in batch:
+            self.write(geo_type, feature)
+
+    def write(self, geo_type, feature):
+        f = self._files[geo_type]
+        f.write(self._separators[geo_type])
+        f.write(json.dumps(feature))
+        self._separators[geo_type] = ", "
+
+    def close(self):
+        for geo_type in self._files:
+            f = self._files[geo_type]
+            f.write(_FOOTER)
+            f.close()
+        self._files = {}
+
+
+class MemoryLayerSink:
+    """
+     * The MemoryLayerSink adds the features directly to a qgis memory layer per geometry type.
+     >> The layers can be given the known fields up front (fields), e.g. from the metadata of the mbtile file.
+        Only fields with one of the type names of the metadata (_metadata_types) are created up front,
+        the type of any other field (e.g. a description in the metadata of OpenMapTiles) is taken from its values.
+     >> Every batch is added in bulk through the data provider (write_batch). Attributes which
+        are not a field yet are created at once for the whole batch beforehand. All numbers are Double fields,
+        a key which is an integer in one feature and a float in another does not need a wider type later.
+     >> The geojson conform geometries are converted to multi geometries (_qgs_geometry).
+     * The ids of the added features are returned, so they can be deleted again later (delete).
+    """
+    _metadata_types = {"Number": QVariant.Double, "Boolean": QVariant.LongLong, "String": QVariant.String}
+
+    def __init__(self, geo_types, name, fields=None, crs=MERCATOR):
+        # fields:: name: type as given in the vector_layers of the mbtile metadata
+        # crs:: the coordinate system of the features, MERCATOR or GEOGRAPHIC
+        self.layers = {}
+        for geo_type in geo_types:
+            layer = QgsVectorLayer("Multi%s?crs=%s" % (geo_type, crs), name, "memory")
+            known = sorted(key for key in fields or {} if fields[key] in self._metadata_types)
+            if known:
+                layer.dataProvider().addAttributes([QgsField(key, self._metadata_types[fields[key]]) for key in known])
+                layer.updateFields()
+            self.layers[geo_type] = layer
+
+    def write_batch(self, batch):
+        # batch:: list of (geo_type, feature) tuples
+        # returns the ids of the added features per geo_type
+        ids = {}
+        features = {}
+        for geo_type, data in batch:
+            features.setdefault(geo_type, []).append(data)
+        for geo_type in features:
+            layer = self.layers[geo_type]
+            self._add_fields(layer, features[geo_type])
+            fields = layer.pendingFields()
+            indices = dict((fields[index].name(), index) for index in range(fields.count()))
+            qgs_features = []
+            for data in features[geo_type]:
+                attributes = [None] * len(indices)
+                for key, value in data["properties"].items():
+                    attributes[indices[key]] = value
+                qgs_feature = QgsFeature(fields)
+                qgs_feature.setGeometry(self._qgs_geometry(data["geometry"]))
+                qgs_feature.setAttributes(attributes)
+                qgs_features.append(qgs_feature)
+            result, added = layer.dataProvider().addFeatures(qgs_features)
+            ids[geo_type] = [qgs_feature.id() for qgs_feature in added]
+            layer.updateExtents()
+            layer.triggerRepaint()
+        return ids
+
+    def delete(self, ids):
+        # ids:: geo_type: list of feature ids
+        for geo_type in ids:
+            if ids[geo_type]:
+                layer = self.layers[geo_type]
+                layer.dataProvider().deleteFeatures(ids[geo_type])
+                layer.updateExtents()
+                layer.triggerRepaint()
+
+    def close(self):
+        pass
+
+    def _add_fields(self, layer, features):
+        # create a field for every attribute which the layer does not have yet
+        names = set(field.name() for field in layer.pendingFields())
+        new_fields = []
+        for data in features:
+            for key, value in data["properties"].items():
+                if key not in names:
+                    names.add(key)
+                    new_fields.append(QgsField(key, self._field_type(value)))
+        if new_fields:
+            layer.dataProvider().addAttributes(new_fields)
+            layer.updateFields()
+
+    @staticmethod
+    def _field_type(value):
+        if isinstance(value, bool):
+            return QVariant.LongLong
+        if isinstance(value, numbers.Number):
+            return QVariant.Double
+        return QVariant.String
+
+    @staticmethod
+    def _qgs_geometry(geometry):
+        # create a multi geometry from the geojson conform geometry
+        geo_type = geometry["type"]
+        coordinates = geometry["coordinates"]
+        if geo_type == "Point":
+            return QgsGeometry.fromMultiPoint([QgsPoint(*coordinates)])
+        if geo_type == "MultiPoint":
+            return QgsGeometry.fromMultiPoint([QgsPoint(*point) for point in coordinates])
+        if geo_type == "LineString":
+            coordinates = [coordinates]
+        if geo_type in ("LineString", "MultiLineString"):
+            return QgsGeometry.fromMultiPolyline([[QgsPoint(*point) for point in line] for line in coordinates])
+        if geo_type == "Polygon":
+            coordinates = [coordinates]
+        return QgsGeometry.fromMultiPolygon(
+            [[[QgsPoint(*point) for point in ring] for ring in polygon] for polygon in coordinates])
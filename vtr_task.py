@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+""" THIS COMMENT MUST NOT REMAIN INTACT
+
+GNU GENERAL PUBLIC LICENSE
+
+Copyright (c) 2015 geometalab HSR
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+"""
+
+from PyQt4.QtCore import QThread, pyqtSignal
+from vtr_connection import ConnectionManager
+from vtr_tile import decode_tiles, MERCATOR
+
+import time
+
+# seconds between two batches of features handed to the layers
+BATCH_INTERVAL = 0.25
+
+
+class LoadTask(QThread):
+    """
+     * The LoadTask reads and decodes the tile rows in the background, so qgis stays responsive.
+     >> The rows of the queries are read over a connection of the task (ConnectionManager.open),
+        they are streamed to the decoder one after the other and the task can be cancelled while reading.
+     >> The total number of tiles is counted first, with the same queries.
+     >> The decoded features are emitted in batches (batchReady), the first batch right after the first tile.
+     >> After every tile the progress is emitted (progressChanged) with the number of decoded and total tiles.
+     >> The features of every single tile are emitted as well (tileReady), for whom needs to know their tile.
+     >> An exception stops the task, its message is emitted (failed) before the task finishes.
+     * cancel stops the task after the tile which is decoded at the moment. The pool of decoding processes
+       is shared with other tasks, only the few tiles this task has handed to it ahead are still decoded.
+    """
+    batchReady = pyqtSignal(object)
+    tileReady = pyqtSignal(object, object)
+    progressChanged = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, database_source, queries, workers=0, source=None, projection=None, crs=MERCATOR,
+                 parent=None):
+        # queries:: list of (sql query, parameters) of the tile rows, see Model.database_command
+        super(LoadTask, self).__init__(parent)
+        self._database_source = database_source
+        self._queries = queries
+        self._workers = workers
+        self._source = source
+        self._projection = projection
+        self._crs = crs
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        try:
+            connection = ConnectionManager.open(self._database_source)
+            try:
+                self._decode(connection)
+            finally:
+                connection.close()
+        except Exception as error:
+            # an exception of a thread would only be printed to the console
+            self.failed.emit("%s: %s" % (type(error).__name__, error))
+
+    def _rows(self, connection):
+        # the tile rows of all the queries, they are fetched while they are decoded
+        for sql_query, parameters in self._queries:
+            for row in connection.execute(sql_query, parameters):
+                yield row
+
+    def _decode(self, connection):
+        total = 0
+        for sql_query, parameters in self._queries:
+            total += connection.execute("SELECT COUNT(*) FROM (%s)" % sql_query.rstrip(";"), parameters).fetchone()[0]
+        self.progressChanged.emit(0, total)
+        batch = []
+        last_emit = 0
+        tiles = decode_tiles(self._rows(connection), self._workers, self._source, self._projection, self._crs)
+        try:
+            for index, (geometry, features) in enumerate(tiles):
+                if self._cancelled:
+                    break
+                batch.extend(features)
+                self.tileReady.emit(geometry, features)
+                self.progressChanged.emit(index + 1, total)
+                if time.time() - last_emit >= BATCH_INTERVAL:
+                    self.batchReady.emit(batch)
+                    batch = []
+                    last_emit = time.time()
+        finally:
+            # commits the tiles decoded so far to the disk cache
+            tiles.close()
+        if batch and not self._cancelled:
+            self.batchReady.emit(batch)
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+
+""" THIS COMMENT MUST NOT REMAIN INTACT
+
+GNU GENERAL PUBLIC LICENSE
+
+Copyright (c) 2015 geometalab HSR
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+"""
+
+from contrib.mapbox_vector_tile import Mapzen
+from contrib.globalmaptiles import GlobalMercator
+from vtr_cache import tile_cache, disk_cache
+
+from collections import deque
+from functools import partial
+
+import multiprocessing
+import os
+import sys
+import zlib
+
+# this module must not depend on qgis, its functions are also run in the decoding processes.
+
+extent = 4096
+
+# the coordinate systems the features can be built in
+MERCATOR = "EPSG:3857"
+GEOGRAPHIC = "EPSG:4326"
+
+_GZIP_MAGIC = bytearray(b"\x1f\x8b")
+
+_pool = None
+_pool_size = 0
+_POOL_WINDOW = 2  # tiles per worker which are handed to the pool ahead
+_worker_mapzen = None  # the decoder of a decoding process
+
+
+def inflate(blob):
+    # inflate a tile blob in memory, the compression is detected by its magic bytes.
+    # gzip and zlib compressed tiles are supported, anything else is passed on as it is, without a copy.
+    # blob:: bytes or any buffer (the buffer of a sqlite row in python 2, a bytearray or a memoryview)
+    header = bytearray(blob[:2])
+    if header == _GZIP_MAGIC:
+        return zlib.decompress(_zlib_input(blob), 16 + zlib.MAX_WBITS)
+    if len(header) == 2 and header[0] & 0x0f == 8 and (header[0] << 8 | header[1]) % 31 == 0:
+        return zlib.decompress(_zlib_input(blob))
+    return blob
+
+
+def _zlib_input(blob):
+    # zlib of python 2 only takes a str or a buffer, a memoryview has to be copied.
+    if sys.version_info[0] == 3 or isinstance(blob, (str, buffer)):
+        return blob
+    if isinstance(blob, memoryview):
+        return blob.tobytes()
+    return buffer(blob)
+
+
+def decode_tile(row, projection=None, mapzen=None, crs=MERCATOR):
+    # inflate, decode and transform a single tile row (zoom_level, tile_column, tile_row, tile_data).
+    # projection:: (layers, keys) allow-lists of the layer names and property keys, None allows everything.
+    # mapzen:: the decoder, pass the same one for many tiles so its state is reused.
+    # crs:: MERCATOR or GEOGRAPHIC, the coordinate system of the features
+    # returns the tile and a list of (geo_type, feature) tuples.
+    return next(decode_rows([row], projection, mapzen, crs))
+
+
+def decode_rows(rows, projection=None, mapzen=None, crs=MERCATOR):
+    # inflate, decode and transform the tile rows one after the other, see decode_tile.
+    for decoded in decode_columns(rows, projection, mapzen):
+        yield _build_tile(decoded, crs)
+
+
+def decode_columns(rows, projection=None, mapzen=None):
+    # inflate and decode the tile rows one after the other, without building the features.
+    # the vertices are decoded straight into the flat mercator coordinates of every layer.
+    # yields the tile (zoom, column, row) and its decoded data with the flat columns (see TileData.getMessage),
+    # which is far more compact to pass between processes than the features.
+    layers, keys = projection or (None, None)
+    tiles = ((row[0], row[1], row[2], inflate(row[3])) for row in rows)
+    return (mapzen or Mapzen()).decode_many(tiles, flat=True, layers=layers, keys=keys, transform=tile_transform)
+
+
+def _decode_in_worker(row, projection=None):
+    # decode a tile into its flat columns in a decoding process, all the tiles of the process share its decoder.
+    # the features are built by the process which receives the columns (_build_tile).
+    global _worker_mapzen
+    if _worker_mapzen is None:
+        _worker_mapzen = Mapzen()
+    return next(decode_columns([row], projection, _worker_mapzen))
+
+
+def _build_tile(decoded, crs=MERCATOR):
+    # the tile and its features of the flat columns of a decoded tile (decode_columns), see decode_tile.
+    tile, decoded_data = decoded
+    return list(tile), FeatureBuilder(crs).write_features(decoded_data)
+
+
+def tile_transform(tile):
+    # the affine transform of the tile from its coordinates into mercator meters, it is the same for all vertices.
+    # tile:: 0: zoom, 1: column, 2: row
+    # returns (scale_x, offset_x, scale_y, offset_y), a vertex (x, y) is at
+    # (int(offset_x + scale_x * x), int(offset_y + scale_y * y)).
+    bounds = GlobalMercator().TileBounds(tile[1], tile[2], tile[0])
+    return (bounds[2] - bounds[0]) / extent, bounds[0], (bounds[3] - bounds[1]) / extent, bounds[1]
+
+
+def projection_key(projection, crs=MERCATOR):
+    # a string which identifies the projection and the coordinate system in the tile caches
+    key = ""
+    if projection is not None:
+        key = ";".join(",".join(sorted(names)) if names is not None else "*" for names in projection)
+    if crs != MERCATOR:
+        key += "@" + crs
+    return key
+
+
+def decode_tiles(rows, workers=0, source=None, projection=None, crs=MERCATOR):
+    # decode all the tile rows, the results are yielded in the order of the rows.
+    # with workers the tiles are fanned out to a pool of that many processes, without (0) they are decoded here.
+    # the processes only decode the tiles into flat columns, the features are built from them here.
+    # a single worker is useful as well, it takes the decoding off the process of qgis.
+    # source:: (path, modification time) of the mbtile file, its decoded tiles are kept in the tile caches.
+    # projection:: (layers, keys) allow-lists, see decode_tile
+    # crs:: the coordinate system of the features, see decode_tile
+    if source:
+        source = tuple(source) + (projection_key(projection, crs),)
+    disk = source and disk_cache(source)
+    try:
+        if workers < 1:
+            if not source:
+                for result in decode_rows(rows, projection, crs=crs):
+                    yield result
+                return
+            # the decoder of this call, the tiles which are not cached yet are decoded with it.
+            mapzen = Mapzen()
+            for row in rows:
+                tile = (row[0], row[1], row[2])
+                result = _cached_tile(source, disk, tile)
+                if not result:
+                    result = decode_tile(row, projection, mapzen, crs)
+                    _cache_tile(source, disk, tile, result)
+                yield result
+            return
+        # only a few tiles per worker are handed to the shared pool ahead of the one which is yielded next.
+        # a call which is not iterated any further leaves just these few tiles behind in the pool,
+        # and the tiles of other calls are not queued behind all the tiles of this one.
+        pool = decoder_pool(workers)
+        decode = partial(_decode_in_worker, projection=projection)
+        window = workers * _POOL_WINDOW
+        queued = deque()  # (tile, cached result, AsyncResult of the pool) in the order of the rows
+        decoding = 0
+        rows = iter(rows)
+        while True:
+            for row in rows:
+                tile = (row[0], row[1], row[2])
+                result = source and _cached_tile(source, disk, tile)
+                pending = None
+                if not result:
+                    pending = pool.apply_async(decode, ((row[0], row[1], row[2], bytes(row[3])),))
+                    decoding += 1
+                queued.append((tile, result, pending))
+                if decoding >= window:
+                    break
+            if not queued:
+                return
+            tile, result, pending = queued.popleft()
+            if pending is not None:
+                decoding -= 1
+                result = _build_tile(pending.get(), crs)
+                if source:
+                    _cache_tile(source, disk, tile, result)
+            yield result
+    finally:
+        if disk:
+            disk.commit()
+
+
+def _cached_tile(source, disk, tile):
+    # look the tile up in memory first, then on disk.
+    result = tile_cache.get(source + tile)
+    if not result and disk:
+        result = disk.get(source[2], tile)
+        if result:
+            tile_cache.put(source + tile, result)
+    return result
+
+
+def _cache_tile(source, disk, tile, result):
+    tile_cache.put(source + tile, result)
+    if disk:
+        disk.put(source[2], tile, result)
+
+
+def decoder_pool(workers):
+    # return the shared pool of decoding processes, it is only recreated if the worker count changed.
+    # the previous pool is closed, not terminated: the tiles other calls have handed to it are still decoded.
+    global _pool, _pool_size
+    if _pool is None or _pool_size != workers:
+        if _pool is not None:
+            _pool.close()
+        if os.name == "nt":
+            # inside qgis sys.executable is qgis itself and can not be used to start the workers.
+            multiprocessing.set_executable(os.path.join(sys.exec_prefix, "pythonw.exe"))
+        _pool = multiprocessing.Pool(workers)
+        _pool_size = workers
+    return _pool
+
+
+def close_pool():
+    # terminate the pool, no call of decode_tiles may be waiting for it anymore.
+    global _pool, _pool_size
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+    _pool = None
+    _pool_size = 0
+
+
+class FeatureBuilder:
+    """
+     * write_features iterates through all the features of a decoded tile, its purpose is to create
+       geojson conform features.
+     >> The tile is decoded into flat columns of mercator coordinates (see TileData.create_columns), the decoder
+        has split the geometries into parts and rings already. Polygon rings are assigned by their winding order.
+     >> The geometry of a feature is built from its slice of the columns (_build_geometry), without recursion.
+        By its geometry type and number of parts it is a Point or MultiPoint, a LineString or MultiLineString,
+        a Polygon or MultiPolygon.
+     >> Features without any vertex are skipped.
+     * In the GEOGRAPHIC coordinate system, the coordinates of a whole layer are converted into longitudes
+       and latitudes at once (_lon_lat), before any geometry is built.
+    """
+    _geo_type_options = {1: "Point", 2: "LineString", 3: "Polygon"}
+
+    def __init__(self, crs=MERCATOR):
+        self._crs = crs
+
+    def write_features(self, decoded_data):
+        # iterate through all the features of the data and build proper gejson conform objects.
+        features = []
+        for name in decoded_data:
+            columns = decoded_data[name]["columns"]
+            coordinates = columns["coordinates"]
+            if self._crs == GEOGRAPHIC:
+                coordinates = _lon_lat(coordinates)
+            vertices = _vertices(coordinates)
+            rings = columns["ring_offsets"].tolist()
+            parts = columns["part_offsets"].tolist()
+            geometries = columns["geometry_offsets"].tolist()
+            for index, data in enumerate(decoded_data[name]["features"]):
+                geo_type = self._geo_type_options[data["type"]]
+                geometry = self._build_geometry(geo_type, vertices, rings, parts,
+                                                geometries[index], geometries[index + 1])
+                if geometry is None:
+                    continue
+                features.append((geo_type, {
+                    "type": "Feature",
+                    "geometry": geometry,
+                    "properties": data["properties"]
+                }))
+        return features
+
+    @staticmethod
+    def _build_geometry(geo_type, vertices, rings, parts, first_part, end_part):
+        # the geometry of the parts first_part to end_part, None if it has no vertex.
+        first_ring = parts[first_part]
+        end_ring = parts[end_part]
+        if first_ring == end_ring:
+            return None
+        if geo_type == "Point":
+            # all points of a feature are a single part
+            points = vertices[rings[first_ring]:rings[end_ring]]
+            if len(points) == 1:
+                return {"type": "Point", "coordinates": points[0]}
+            return {"type": "MultiPoint", "coordinates": points}
+        if geo_type == "LineString":
+            # every line is a part of its own
+            lines = [vertices[rings[ring]:rings[ring + 1]] for ring in range(first_ring, end_ring)]
+            if len(lines) == 1:
+                return {"type": "LineString", "coordinates": lines[0]}
+            return {"type": "MultiLineString", "coordinates": lines}
+        polygons = [[vertices[rings[ring]:rings[ring + 1]] for ring in range(parts[part], parts[part + 1])]
+                    for part in range(first_part, end_part)]
+        if len(polygons) == 1:
+            return {"type": "Polygon", "coordinates": polygons[0]}
+        return {"type": "MultiPolygon", "coordinates": polygons}
+
+
+def _vertices(coordinates):
+    # the flat coordinates of a layer as a list of [x, y] vertices
+    if hasattr(coordinates, "reshape"):
+        # a numpy array
+        return coordinates.reshape(-1, 2).tolist()
+    return [[x, y] for x, y in zip(coordinates[0::2], coordinates[1::2])]
+
+
+def _lon_lat(coordinates):
+    # the flat mercator coordinates of a layer as flat longitudes and latitudes
+    if hasattr(coordinates, "reshape"):
+        # a numpy array, it is converted in bulk
+        lon_lat = coordinates.reshape(-1, 2).astype("float64")
+        lat, lon = GlobalMercator().MetersToLatLonArray(lon_lat[:, 0], lon_lat[:, 1])
+        lon_lat[:, 0] = lon
+        lon_lat[:, 1] = lat
+        return lon_lat.ravel()
+    lat, lon = GlobalMercator().MetersToLatLonArray(coordinates[0::2], coordinates[1::2])
+    lon_lat = [0.0] * len(coordinates)
+    lon_lat[0::2] = lon
+    lon_lat[1::2] = lat
+    return lon_lat